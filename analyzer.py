@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Validation and analysis of universe files. Mistakes in a universe otherwise
+only show up when a query is compiled: joins to tables that don't exist,
+'Joins' written as a list instead of a dictionary, presets missing a key, or
+tables that can't be joined to each other at all. analyze checks the tables
+and presets once and reports:
+
+errors: problems that make loading the universe or compiling queries fail.
+warnings: things that are probably mistakes, but don't break anything.
+statistics: the connected components of the join graph, the number of table
+pairs that can't be joined, the degree distribution and the diameter. The
+tables with the most joins and the pair of tables furthest apart are the
+slowest cases for join planning.
+
+Run it on universe files with:
+    python analyzer.py universe.uni
+Universe(filename, validate=True) runs the same checks at load and raises a
+ValueError listing the errors.
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter, deque
+
+REQUIRED_KEYS = ('tag', 'DBHandle', 'Priority')
+JOIN_TYPES = ('inner', 'left', 'right', 'full', 'cross')
+PRESET_KEYS = ('table', 'column', 'where')
+
+# Above this many tables the diameter is estimated with a few sweeps of
+# breadth-first search instead of searching from every table.
+EXACT_DIAMETER_LIMIT = 2000
+
+
+def first_value(properties, key):
+    """
+    The first entry of a key stored as a one-element list, or None if it isn't
+    there.
+    """
+    value = properties.get(key)
+    if isinstance(value, list) and value:
+        return value[0]
+    return None
+
+
+def check_table(table, properties, tables, errors, warnings):
+    """
+    Checks the keys of one table and its joins. Returns the tables it joins
+    to that exist.
+    """
+    if not hasattr(properties, 'get'):
+        errors.append('table {}: is not an object'.format(table))
+        return []
+    for key in REQUIRED_KEYS:
+        if first_value(properties, key) is None:
+            errors.append('table {}: {} is missing or not a non-empty list'.format(table, key))
+    priority = first_value(properties, 'Priority')
+    if priority is not None and not isinstance(priority, (int, float)):
+        errors.append('table {}: Priority is not a number'.format(table))
+    if 'Columns' not in properties:
+        warnings.append('table {}: has no Columns'.format(table))
+    rows = properties.get('Rows')
+    if rows is not None and not isinstance(rows, (int, float)):
+        warnings.append('table {}: Rows is not a number'.format(table))
+    joins = properties.get('Joins', {})
+    foreign_keys = properties.get('ForeignKey', {})
+    if not isinstance(foreign_keys, dict):
+        errors.append('table {}: ForeignKey is not an object'.format(table))
+    else:
+        for other in foreign_keys:
+            if other not in tables:
+                errors.append('table {}: foreign key to unknown table {}'.format(table, other))
+            elif (other not in (joins if isinstance(joins, dict) else {})
+                  and table not in (tables[other].get('Joins') or {})):
+                warnings.append('table {}: foreign key to {}, which it has no join with'.format(
+                    table, other))
+    if isinstance(joins, list):
+        if joins:
+            errors.append('table {}: Joins is a non-empty list instead of an object'.format(table))
+        else:
+            warnings.append('table {}: Joins is an empty list instead of an object'.format(table))
+        return []
+    if not isinstance(joins, dict):
+        errors.append('table {}: Joins is not an object'.format(table))
+        return []
+    joined = []
+    for other, join in joins.items():
+        if other not in tables:
+            errors.append('table {}: joins to unknown table {}'.format(table, other))
+            continue
+        if other == table:
+            warnings.append('table {}: joins to itself'.format(table))
+        joined.append(other)
+        if (not isinstance(join, list) or len(join) != 2
+                or not all(isinstance(part, str) for part in join)):
+            errors.append('table {}: join to {} is not [on string, join type]'.format(
+                table, other))
+        elif join[1].lower() not in JOIN_TYPES:
+            warnings.append('table {}: join to {} has unknown join type {!r}'.format(
+                table, other, join[1]))
+    return joined
+
+
+def check_presets(presets, tables, errors):
+    """
+    Checks that every preset has its keys and refers to an existing table.
+    """
+    for preset, properties in presets.items():
+        for key in PRESET_KEYS:
+            if first_value(properties, key) is None:
+                errors.append('preset {}: {} is missing or not a non-empty list'.format(
+                    preset, key))
+        table = first_value(properties, 'table')
+        if table is not None and table not in tables:
+            errors.append('preset {}: refers to unknown table {}'.format(preset, table))
+
+
+def distances(connections, source):
+    """
+    Breadth-first search from source. Returns the number of joins to every
+    reachable table.
+    """
+    found = {source: 0}
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        for connected_node in connections[node]:
+            if connected_node not in found:
+                found[connected_node] = found[node] + 1
+                queue.append(connected_node)
+    return found
+
+
+def components(connections):
+    """
+    The connected components of the join graph, largest first.
+    """
+    seen = set()
+    found = []
+    for table in connections:
+        if table not in seen:
+            component = list(distances(connections, table))
+            seen.update(component)
+            found.append(component)
+    found.sort(key=len, reverse=True)
+    return found
+
+
+def farthest(connections, source):
+    """
+    The number of joins from source to the table furthest from it, and that
+    table.
+    """
+    found = distances(connections, source)
+    end = max(found, key=found.get)
+    return found[end], end
+
+
+def diameter(connections, component):
+    """
+    Returns the largest number of joins between two tables of a component,
+    the two tables, and whether it is exact. Large components are estimated
+    from a few sweeps, which gives a lower bound.
+    """
+    best = (0, component[0], component[0])
+    if len(component) <= EXACT_DIAMETER_LIMIT:
+        for start in component:
+            length, end = farthest(connections, start)
+            if length > best[0]:
+                best = (length, start, end)
+        return best[0], best[1:], True
+    start = component[0]
+    for _ in range(4):
+        length, end = farthest(connections, start)
+        if length > best[0]:
+            best = (length, start, end)
+        start = end
+    return best[0], best[1:], False
+
+
+def graph_statistics(connections):
+    """
+    Statistics of the join graph, see the module docstring.
+    """
+    found = components(connections)
+    degrees = {table: len(connected) for table, connected in connections.items()}
+    tables = len(connections)
+    reachable_pairs = sum(len(component) * (len(component) - 1) // 2
+                          for component in found)
+    statistics = {'tables': tables,
+                  'joins': sum(degrees.values()) // 2,
+                  'components': [len(component) for component in found],
+                  'unreachable_pairs': tables * (tables - 1) // 2 - reachable_pairs,
+                  'degree_distribution': dict(sorted(Counter(degrees.values()).items())),
+                  'most_joined': sorted(degrees, key=lambda table: (-degrees[table], table))[:5]}
+    if tables:
+        statistics['mean_degree'] = sum(degrees.values()) / tables
+        statistics['max_degree'] = max(degrees.values())
+        length, pair, exact = diameter(connections, found[0])
+        statistics['diameter'] = length
+        statistics['furthest_pair'] = list(pair)
+        statistics['diameter_exact'] = exact
+    return statistics
+
+
+def analyze(tables, presets):
+    """
+    Checks the tables and presets of a universe and analyzes its join graph.
+    Returns a dictionary with 'errors', 'warnings' and 'statistics'.
+    """
+    errors = []
+    warnings = []
+    connections = {table: {} for table in tables}
+    tags = {}
+    for table, properties in tables.items():
+        for other in check_table(table, properties, tables, errors, warnings):
+            if other != table:
+                connections[table][other] = True
+                connections[other][table] = True
+        tag = first_value(properties, 'tag') if hasattr(properties, 'get') else None
+        if tag is not None:
+            if tag != table:
+                errors.append('table {}: tag {} differs from the table name, but '
+                              'find_joins looks tables up by tag'.format(table, tag))
+            if tag in tags:
+                errors.append('table {}: tag {} is also used by table {}'.format(
+                    table, tag, tags[tag]))
+            tags[tag] = table
+    check_presets(presets, tables, errors)
+    statistics = graph_statistics(connections)
+    isolated = sorted(table for table, connected in connections.items() if not connected)
+    if len(tables) > 1 and isolated:
+        warnings.append('tables without joins: ' + ', '.join(isolated))
+    if len(statistics['components']) > 1:
+        warnings.append('{} tables in {} separate groups; {} pairs of tables can not be '
+                        'joined'.format(len(tables), len(statistics['components']),
+                                        statistics['unreachable_pairs']))
+    return {'errors': errors, 'warnings': warnings, 'statistics': statistics}
+
+
+def analyze_file(filename):
+    """
+    Parses a universe file and analyzes it. The file is parsed on its own, so
+    universes that fail to load can be analyzed too.
+    """
+    with open(filename, 'rb') as file:
+        universe = json.loads(file.read().decode('utf-8'))
+    return analyze(universe.get('graph', {}), universe.get('presets', {}))
+
+
+def check_universe(tables, presets):
+    """
+    Raises a ValueError listing the errors of a universe, if there are any.
+    """
+    errors = analyze(tables, presets)['errors']
+    if errors:
+        raise ValueError('invalid universe:\n' + '\n'.join(errors))
+
+
+def format_report(report):
+    """
+    The report of analyze as lines of text.
+    """
+    lines = ['error: ' + error for error in report['errors']]
+    lines += ['warning: ' + warning for warning in report['warnings']]
+    lines += ['{}: {}'.format(key, value) for key, value in report['statistics'].items()]
+    return '\n'.join(lines)
+
+
+def main(arguments=None):
+    """
+    Analyzes the universe files given on the command line. Returns 1 if any
+    of them has errors, 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(description='Validate and analyze universe files.')
+    parser.add_argument('universes', nargs='+', help='universe files (.uni or .JSON)')
+    parser.add_argument('--json', action='store_true', help='write the reports as JSON')
+    options = parser.parse_args(arguments)
+    status = 0
+    reports = {}
+    for filename in options.universes:
+        try:
+            report = analyze_file(filename)
+        except (OSError, ValueError) as error:
+            report = {'errors': ['{}: {}'.format(type(error).__name__, error)],
+                      'warnings': [], 'statistics': {}}
+        if report['errors']:
+            status = 1
+        reports[filename] = report
+        if not options.json:
+            print(filename)
+            print(format_report(report))
+    if options.json:
+        print(json.dumps(reports, indent=2))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
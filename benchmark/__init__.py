@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for universe loading, join planning and query compilation on
+synthetic universes. Run with python -m benchmark.run from the repository root.
+"""
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Generator for synthetic universes in the same JSON format as example.JSON.
+The shape decides how the tables are joined:
+
+chain: every table joins the previous one.
+star: every table joins the first table.
+snowflake: a tree in which every table joins a parent, with a fixed number
+of children per table.
+random: a random spanning tree.
+
+On top of the shape, density * tables extra joins between random pairs of
+tables are added.
+"""
+
+import json
+import random
+
+SHAPES = ('chain', 'star', 'snowflake', 'random')
+
+
+def table_name(index):
+    """
+    Name of the table with the given index.
+    """
+    return 'table{}'.format(index)
+
+
+def parents(tables, shape, branching, rnd):
+    """
+    Returns for every table after the first the index of the table it joins.
+    """
+    if shape == 'chain':
+        return [index - 1 for index in range(1, tables)]
+    if shape == 'star':
+        return [0] * (tables - 1)
+    if shape == 'snowflake':
+        return [(index - 1) // branching for index in range(1, tables)]
+    if shape == 'random':
+        return [rnd.randrange(index) for index in range(1, tables)]
+    raise ValueError('Unknown shape: ' + str(shape))
+
+
+def join_string(table1, table2, column):
+    """
+    On-string of a join between two tables.
+    """
+    return 'on {0}.{2} = {1}.{2}'.format(table1, table2, column)
+
+
+def generate_universe(tables, shape='random', density=0.0, columns=10,
+                      branching=4, seed=0):
+    """
+    Returns a universe dictionary with the given number of tables, joined
+    according to shape, and the given number of columns per table.
+    """
+    rnd = random.Random(seed)
+    names = [table_name(index) for index in range(tables)]
+    graph = {}
+    for name in names:
+        graph[name] = {'tag': [name],
+                       'DBHandle': ['dbo.' + name],
+                       'Priority': [rnd.randint(1, 10)],
+                       'Columns': ['column{}'.format(index) for index in range(columns)],
+                       'Rows': [rnd.randint(10, 10 ** 7)],
+                       'Joins': {}}
+    for child, parent in enumerate(parents(tables, shape, branching, rnd), 1):
+        graph[names[parent]]['Joins'][names[child]] = [
+            join_string(names[parent], names[child], 'column0'), 'inner']
+    for _ in range(int(density * tables)):
+        table1, table2 = rnd.sample(names, 2)
+        if table2 in graph[table1]['Joins'] or table1 in graph[table2]['Joins']:
+            continue
+        graph[table1]['Joins'][table2] = [
+            join_string(table1, table2, 'column1'), rnd.choice(['inner', 'left'])]
+    return {'graph': graph, 'presets': {}}
+
+
+def write_universe(filename, **options):
+    """
+    Generates a universe (see generate_universe) and writes it to filename.
+    """
+    with open(filename, 'w', encoding='utf-8') as file:
+        json.dump(generate_universe(**options), file)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Load test of the query service: starts a QueryService on a synthetic
+universe, lets many clients send selection specs over TCP at the same time
+and reports the throughput and the latency percentiles seen by the clients,
+next to the statistics of the service itself. Run from the repository root:
+
+    python -m benchmark.load --tables 200 --clients 50 --requests 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from benchmark.generate import SHAPES, write_universe
+from service import ConnectionPool, QueryService
+from standin import create_sqlite
+
+
+def percentiles(latencies, percentages=(50, 90, 99)):
+    """
+    Latency in seconds at the given percentages.
+    """
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+    return {'p{}'.format(percentage):
+            latencies[min(len(latencies) - 1, len(latencies) * percentage // 100)]
+            for percentage in percentages}
+
+
+async def client(port, specs, latencies):
+    """
+    Sends specs one at a time, waiting for every answer, and records the
+    latency of each. Waits for the service to close the connection.
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        for spec in specs:
+            start = time.perf_counter()
+            writer.write((json.dumps(spec) + '\n').encode('utf-8'))
+            await writer.drain()
+            await reader.readline()
+            latencies.append(time.perf_counter() - start)
+        writer.write_eof()
+        await reader.read()
+    finally:
+        writer.close()
+
+
+async def run_load(filename, options):
+    """
+    Runs the clients against a service on filename and returns the report.
+    """
+    rnd = random.Random(options.seed)
+    service = QueryService(filename, workers=options.workers)
+    if options.validate_sqlite:
+        service.pool = ConnectionPool(lambda: create_sqlite(service.universe),
+                                      options.pool_size)
+    names = sorted(service.universe.tables)
+    server = await service.start('127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    start = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(
+            client(port,
+                   [{'tables': rnd.sample(names, min(options.tables_per_query, len(names)))}
+                    for _ in range(options.requests)],
+                   latencies)
+            for _ in range(options.clients)))
+    seconds = time.perf_counter() - start
+    service.executor.shutdown()
+    return {'requests': len(latencies),
+            'seconds': seconds,
+            'requests_per_second': len(latencies) / seconds,
+            'latency': percentiles(latencies),
+            'service': service.statistics()}
+
+
+def parse_arguments(arguments=None):
+    """
+    Parses the command line.
+    """
+    parser = argparse.ArgumentParser(description='Load test the query service.')
+    parser.add_argument('--tables', type=int, default=200,
+                        help='number of tables of the generated universe')
+    parser.add_argument('--shape', choices=SHAPES, default='random')
+    parser.add_argument('--density', type=float, default=0.5)
+    parser.add_argument('--tables-per-query', type=int, default=5)
+    parser.add_argument('--clients', type=int, default=50,
+                        help='concurrent connections')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='specs sent per client')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='threads of the service')
+    parser.add_argument('--validate-sqlite', action='store_true')
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='file to save the report as JSON')
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    """
+    Generates the universe, runs the load test and prints or saves the
+    report.
+    """
+    options = parse_arguments(arguments)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'load.uni')
+        write_universe(filename, tables=options.tables, shape=options.shape,
+                       density=options.density, seed=options.seed)
+        result = asyncio.run(run_load(filename, options))
+    print('{requests} requests in {seconds:.2f}s: {requests_per_second:.0f}/s, '
+          'p99 {p99:.4f}s'.format(p99=result['latency'].get('p99', 0.0), **result),
+          file=sys.stderr)
+    report = {'python': platform.python_version(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'options': vars(options),
+              'result': result}
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
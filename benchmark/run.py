@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Times universe loading, path search, join planning and query compilation on
+synthetic universes of growing size, and saves the results as JSON so runs can
+be compared. Run from the repository root:
+
+    python -m benchmark.run --sizes 10 100 400 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmark.generate import SHAPES, write_universe
+from classes import JOIN_PLANNERS, Query, Universe
+
+
+def timed(function, repeat):
+    """
+    Calls function repeat times and returns the median and minimum duration
+    in seconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), min(durations)
+
+
+def selections(universe, count, size, rnd):
+    """
+    Random selections of size tables from the universe.
+    """
+    names = sorted(universe.tables)
+    return [rnd.sample(names, min(size, len(names))) for _ in range(count)]
+
+
+def compile_selections(universe, tables_per_query, planner):
+    """
+    Compiles every selection in a fresh Query, so no cached result is reused.
+    """
+    for tables in tables_per_query:
+        query = Query(universe)
+        query.planner = planner
+        for table in tables:
+            query.add_tables(table)
+        query.compile_query()
+
+
+def benchmark_universe(filename, shape, size, options):
+    """
+    Runs all phases on one universe file and returns a list of results.
+    """
+    rnd = random.Random(options.seed)
+    results = []
+
+    def record(phase, function, operations=1, planner=None):
+        median, minimum = timed(function, options.repeat)
+        results.append({'shape': shape,
+                        'tables': size,
+                        'phase': phase,
+                        'planner': planner,
+                        'seconds': median / operations,
+                        'min_seconds': minimum / operations})
+
+    record('load', lambda: Universe(filename))
+    universe = Universe(filename)
+    if size <= options.max_index_size:
+        record('path_index', universe.build_path_index)
+    pairs = selections(universe, options.queries, 2, rnd)
+    record('shortest_path',
+           lambda: [universe.shortest_path(start, end) for start, end in pairs],
+           len(pairs))
+    tables_per_query = selections(universe, options.queries,
+                                  options.tables_per_query, rnd)
+    for planner in JOIN_PLANNERS:
+        record('join_paths',
+               lambda: [universe.join_paths(tables, planner) for tables in tables_per_query],
+               len(tables_per_query), planner)
+    record('compile_query',
+           lambda: compile_selections(universe, tables_per_query, 'greedy'),
+           len(tables_per_query), 'greedy')
+    return results
+
+
+def parse_arguments(arguments=None):
+    """
+    Parses the command line.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the SQL builder.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 100, 200],
+                        help='numbers of tables of the generated universes')
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=list(SHAPES))
+    parser.add_argument('--density', type=float, default=0.5,
+                        help='extra joins per table on top of the shape')
+    parser.add_argument('--columns', type=int, default=20,
+                        help='columns per table')
+    parser.add_argument('--tables-per-query', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=20,
+                        help='selections planned and compiled per phase')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-index-size', type=int, default=1000,
+                        help='largest universe to build the all-pairs index for')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='file to save the results as JSON')
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    """
+    Generates the universes, runs the benchmarks and prints or saves the
+    results.
+    """
+    options = parse_arguments(arguments)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for shape in options.shapes:
+            for size in options.sizes:
+                filename = os.path.join(directory, '{}_{}.uni'.format(shape, size))
+                write_universe(filename, tables=size, shape=shape,
+                               density=options.density, columns=options.columns,
+                               seed=options.seed)
+                for result in benchmark_universe(filename, shape, size, options):
+                    results.append(result)
+                    print('{shape:>9} {tables:>6} {phase:>14} {planner!s:>8} '
+                          '{seconds:.6f}s'.format(**result), file=sys.stderr)
+    report = {'python': platform.python_version(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'options': vars(options),
+              'results': results}
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled universe cache. Parsing a large universe JSON and building its edges
+takes a while, so the result can be pickled to a file next to the universe.
+The cache remembers the modification time, size and hash of the source file.
+When the modification time or size changed, the hash decides whether the cache
+is still valid; if it isn't, the universe is parsed again and the cache is
+rewritten.
+
+The other files kept next to a universe, the sidecar of lazy.py and the path
+index of pathindex.py, are written and checked the same way, with the helpers
+here: a small header that is checked before the rest of the file is read.
+"""
+import os
+import pickle
+from hashlib import sha1
+
+# Increase when the layout of the cached state changes, to invalidate old caches.
+CACHE_FORMAT = 4
+CACHE_EXTENSION = '.cache'
+
+
+def cache_filename(filename):
+    """
+    Location of the cache belonging to a universe file.
+    """
+    return filename + CACHE_EXTENSION
+
+
+def file_hash(filename):
+    """
+    SHA-1 of the contents of a file, used as version of a universe.
+    """
+    digest = sha1()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_header(file, file_format, keys=()):
+    """
+    Unpickles the header at the start of an open file next to a universe, as
+    written by write_file. Returns None unless it is a header of file_format
+    with all of keys; anything that fails to unpickle, for instance because
+    it refers to a class that was renamed since, counts as no header.
+    """
+    try:
+        header = pickle.load(file)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    if (not isinstance(header, dict) or header.get('format') != file_format
+            or any(key not in header for key in keys)):
+        return None
+    return header
+
+
+def read_payload(file):
+    """
+    Unpickles the next object of an open file, or returns None if that fails.
+    """
+    try:
+        return pickle.load(file)
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def source_state(header, filename, stat):
+    """
+    Compares a header with the universe file it was written for, given its
+    os.stat result: 'current' if the modification time and size still
+    match, 'touched' if they don't but the contents still have the version of
+    the header, and None if the file changed.
+    """
+    if (header['mtime'], header['size']) == (stat.st_mtime_ns, stat.st_size):
+        return 'current'
+    if header['version'] == file_hash(filename):
+        return 'touched'
+    return None
+
+
+def write_file(path, header, *payloads):
+    """
+    Writes a file next to a universe: the pickled header, then the payloads,
+    pickled unless they already are bytes. The file is written to a
+    temporary file first and then moved in place, so readers never see half
+    a file. Raises OSError if it can't be written.
+    """
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as file:
+        pickle.dump(header, file, pickle.HIGHEST_PROTOCOL)
+        for payload in payloads:
+            if isinstance(payload, bytes):
+                file.write(payload)
+            else:
+                pickle.dump(payload, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+
+
+def read_cache(filename):
+    """
+    Returns the compiled state stored for filename, or None if there is no
+    cache or it is outdated. A cache whose source only got a new modification
+    time, but kept the same contents, is refreshed and used. The header of the
+    cache is checked before the state is unpickled.
+    """
+    try:
+        stat = os.stat(filename)
+        with open(cache_filename(filename), 'rb') as file:
+            header = read_header(file, CACHE_FORMAT, ('mtime', 'size', 'version'))
+            if header is None:
+                return None
+            current = source_state(header, filename, stat)
+            if current is None:
+                return None
+            state = read_payload(file)
+    except OSError:
+        return None
+    if state is not None and current == 'touched':
+        write_cache(filename, state, stat)
+    return state
+
+
+def write_cache(filename, state, stat):
+    """
+    Stores the compiled state of filename, after a header with the format of
+    the cache, the modification time and size of the source and its version.
+    stat is the os.stat result of the source taken before it was read, so a
+    change during parsing is noticed the next time. Failing to write, e.g. on
+    a read-only share, isn't an error; the universe is simply parsed again
+    next time.
+    """
+    header = {'format': CACHE_FORMAT,
+              'mtime': stat.st_mtime_ns,
+              'size': stat.st_size,
+              'version': state['version']}
+    try:
+        write_file(cache_filename(filename), header, state)
+    except OSError:
+        pass
@@ -4,31 +4,181 @@ Created on Thu Aug  3 14:33:44 2017
 
 @author: jdubbeldam
 """
-from json import loads
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+from json import JSONDecodeError, loads
+
+import analyzer
+import cache
+import lazy
+import pathindex
+from emit import DEFAULT_DIALECT, Emitter
+from graph import CompactGraph
+from optimize import expand_star, prune_joins
+from params import bind_parameters
+from search import NameIndex
+from state import QueryState
+from stats import increment, measure
+
+JOIN_PLANNERS = ('greedy', 'bfs', 'steiner', 'cost')
+
+# The way to join when the tables of a join are swapped.
+FLIPPED_JOINS = {'left': 'right', 'right': 'left'}
+
+# Planners whose join trees the 'estimated' planner chooses from.
+ESTIMATED_PLANNERS = ('greedy', 'steiner', 'cost')
+
+# Process-wide registry of loaded universes, see load_universe.
+_UNIVERSES = {}
+_UNIVERSES_LOCK = threading.Lock()
 
 class Universe:
     """
     The Universe is a context for the Query class. It contains the information
     of the available Database tables and their relation to eachother. This
-    information is stored in a JSON file.
+    information is stored in a JSON file. A loaded universe is shared by all
+    queries built on it, so it is treated as read-only after loading.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, precompute_paths=False, use_cache=False,
+                 stats=None, lazy_columns=False, validate=False):
         """
         Reads the JSON and separates the information in a presets dictionary and
         a graph dictionary. The latter contains the information of the nodes in
-        the universe/graph, including relational information.
+        the universe/graph, including relational information. If
+        precompute_paths is set, a next-hop table for all pairs of nodes is
+        loaded from the persisted path index (see pathindex.py) or built once,
+        so later path lookups don't need to search the graph.
+        With use_cache, the parsed universe is stored in a compiled cache next
+        to the file and loaded from there as long as the file doesn't change.
+        version is the SHA-1 of the file contents.
+
+        Tables can optionally carry cost metadata: 'Rows' with the estimated
+        row count of the table, and 'Selectivity' or 'Cardinality' dictionaries
+        keyed like 'Joins' with the selectivity of a join or the estimated
+        number of rows it produces. 'ForeignKey', keyed like 'Joins', marks the
+        joins where every row of the table references exactly one row of the
+        other table (see optimize.py).
+
+        stats is an optional stats.Stats object that records the time spent in
+        each phase of loading and planning.
+
+        With lazy_columns, only the join topology and the keys needed to emit
+        joins are loaded; the columns and other metadata of a table are read
+        from an indexed sidecar file when first accessed (see lazy.py). This
+        replaces the compiled cache, so it can't be combined with use_cache.
+
+        With validate, the tables and presets are checked before the graph is
+        built (see analyzer.py), and a ValueError listing the errors is raised
+        for an invalid universe.
+        """
+        if lazy_columns and use_cache:
+            raise ValueError('lazy_columns and use_cache can not be combined')
+        self.filename = filename
+        self.stats = stats
+        self.name_indexes = {}
+        with measure(stats, 'load'):
+            stat = os.stat(filename)
+            state = cache.read_cache(filename) if use_cache else None
+            if lazy_columns:
+                self.load_lazy(filename, validate)
+            elif state is None:
+                self.load_json(filename, validate)
+            else:
+                self.__dict__.update(state)
+                increment(stats, 'cache_loads')
+                if validate:
+                    analyzer.check_universe(self.tables, self.presets)
+            if precompute_paths and self.next_hop is None:
+                with measure(stats, 'path_index'):
+                    self.next_hop = pathindex.read_index(self)
+                    if self.next_hop is None:
+                        self.next_hop = self.build_path_index()
+                state = None
+            if use_cache and state is None:
+                cache.write_cache(filename, self.compiled_state(), stat)
+
+    def load_json(self, filename, validate=False):
+        """
+        Parses the universe file and builds the edges.
         """
-        with open(filename, encoding='utf-8') as file:
-            json = loads(str(file.read()))
+        with measure(self.stats, 'load_json'):
+            with open(filename, 'rb') as file:
+                contents = file.read()
+            json = loads(contents.decode('utf-8'))
+        self.version = sha1(contents).hexdigest()
         self.presets = json['presets']
         self.tables = json['graph']
-        self.connections = self.get_edges()
+        self.build_graph(validate)
+
+    def load_lazy(self, filename, validate=False):
+        """
+        Loads the universe from its sidecar, building that first if needed,
+        and builds the edges.
+        """
+        with measure(self.stats, 'load_sidecar'):
+            self.version, self.presets, self.tables = lazy.load_tables(filename)
+        self.build_graph(validate)
+
+    def build_graph(self, validate=False):
+        """
+        Derives the edges, the default row count and the (DBHandle, tag) of
+        every table from the loaded tables, after checking them if validate is
+        set.
+        """
+        if validate:
+            with measure(self.stats, 'validate'):
+                analyzer.check_universe(self.tables, self.presets)
+        with measure(self.stats, 'get_edges'):
+            self.graph = CompactGraph(self.get_edges())
+        self.default_rows = self.get_default_rows()
+        self.handles = {table: (properties['DBHandle'][0], properties['tag'][0])
+                        for table, properties in self.tables.items()}
+        self.next_hop = None
+
+    @property
+    def connections(self):
+        """
+        Dictionary with for each node the list of nodes that join on it, as
+        returned by get_edges. It is derived from the compact graph on access.
+        """
+        return {name: self.table_names(self.graph.neighbours(node))
+                for node, name in enumerate(self.graph.names)}
+
+    def compiled_state(self):
+        """
+        The attributes that make up a loaded universe, as stored in the
+        compiled cache.
+        """
+        return {'version': self.version,
+                'presets': self.presets,
+                'tables': self.tables,
+                'graph': self.graph,
+                'default_rows': self.default_rows,
+                'handles': self.handles,
+                'next_hop': self.next_hop}
+
+    def column_index(self, table):
+        """
+        Search index over the columns of table (see search.py), built the first
+        time it is needed.
+        """
+        index = self.name_indexes.get(table)
+        if index is None:
+            index = NameIndex(self.tables[table].get('Columns', []))
+            self.name_indexes[table] = index
+        return index
 
     def get_edges(self):
         """
         Creates a dictionary with for each node a list of nodes that join on
-        that node.
+        that node. Sets are kept next to the lists, so checking whether a join
+        is already known doesn't scan the list. A table without 'Joins' only
+        has the joins other tables store to it.
         """
 
         edges = {}
@@ -36,85 +186,583 @@ class Universe:
             edges[table] = []
             try:
                 edges[table] += [connected_tables
-                                 for connected_tables in self.tables[table]['Joins']]
+                                 for connected_tables in self.tables[table].get('Joins', {})]
             except AttributeError:
                 pass
+        members = {table: set(edges[table]) for table in edges}
         for node in edges:
             for connected_node in edges[node]:
-                if node not in edges[connected_node]:
+                if node not in members[connected_node]:
                     edges[connected_node].append(node)
+                    members[connected_node].add(node)
         return edges
 
-    def shortest_path(self, start, end, path_argument=None):
+    def shortest_path(self, start, end, path_argument=None, stats=None):
         """
-        Calculates the shortest path in a graph, using the dictionary created
-        in getEgdes. Adapted from https://www.python.org/doc/essays/graphs/.
+        Calculates the shortest path in a graph, using the compact graph built
+        from get_edges. The search is an iterative breadth-first search, so the
+        first path found is the shortest. Neighbours are expanded in the order
+        of self.connections, which makes the result the same path the original
+        depth-first search (https://www.python.org/doc/essays/graphs/) returned.
+        Nodes in path_argument are not visited again, and the returned path is
+        prefixed with path_argument. Returns None if end can't be reached.
+        The number of expanded nodes is counted in stats, which defaults to the
+        stats of the universe.
         """
+        stats = self.stats if stats is None else stats
         if path_argument is None:
             old_path = []
         else:
             old_path = path_argument
-        path = old_path + [start]
         if start == end:
-            return path
-        if start not in self.connections:
+            return old_path + [start]
+        ids = self.graph.ids
+        if start not in ids or end not in ids:
             return None
-        shortest = None
-        for node in self.connections[start]:
-            if node not in path:
-                newpath = self.shortest_path(node, end, path)
-                if newpath:
-                    if not shortest or len(newpath) < len(shortest):
-                        shortest = newpath
-        return shortest
+        excluded = [ids[node] for node in old_path if node in ids]
+        path = None
+        if self.next_hop is not None:
+            path = self.graph.indexed_path(self.next_hop, ids[start], ids[end])
+            if path is not None and set(path[1:]).intersection(excluded):
+                path = None
+            if path is not None:
+                increment(stats, 'path_index_hits')
+        if path is None:
+            path, expanded = self.graph.nearest_path([ids[start]], {ids[end]}, excluded)
+            increment(stats, 'nodes_expanded', expanded)
+        if path is None:
+            return None
+        return old_path + self.table_names(path)
 
-    def join_paths(self, nodes):
+    def table_names(self, path):
+        """
+        Translates a path of ids of the compact graph to table names.
+        """
+        names = self.graph.names
+        return [names[node] for node in path]
+
+    def build_path_index(self):
+        """
+        Precomputes a next-hop table for every pair of connected nodes by running
+        one breadth-first search per node. next_hop[start][end] holds the id of
+        the node that follows start on the shortest path to end, so a path
+        lookup only costs the length of the path.
+        """
+        return self.graph.next_hop_table()
+
+    def nearest_path(self, sources, targets, stats=None):
+        """
+        Multi-source breadth-first search. All nodes in sources are expanded at
+        once, in the order given, and the search stops at the first node in
+        targets that is reached. Returns the path from one of the sources to
+        that target, or None if no target can be reached. A target that already
+        is one of the sources is returned as a path of a single node.
+        """
+        stats = self.stats if stats is None else stats
+        ids = self.graph.ids
+        path, expanded = self.graph.nearest_path(
+            [ids[source] for source in sources if source in ids],
+            {ids[target] for target in targets if target in ids})
+        increment(stats, 'nodes_expanded', expanded)
+        if path is None:
+            return None
+        return self.table_names(path)
+
+    def join_paths(self, nodes, planner='greedy', stats=None):
         """
         Extension of shortest_path to work with multiple nodes to be connected.
         The nodes are sorted based on the priority, which is taken from the JSON.
-        shortest_path is called on the first two nodes, then iteratively on each
-        additional node and one of the existing nodes returned by shortest_path,
-        selecting the one that takes the fewest steps.
+        The planner decides how the remaining nodes are attached:
+
+        greedy: shortest_path is called on the first two nodes, then iteratively
+        on each additional node and one of the existing nodes returned by
+        shortest_path, selecting the one that takes the fewest steps.
+        bfs: same result as greedy, but each additional node is attached with a
+        single multi-source search from all nodes already in the paths.
+        steiner: approximates the smallest tree connecting all nodes by always
+        attaching the remaining node that is closest to the current paths,
+        rather than the next one by priority.
+        cost: like steiner, but distances are the estimated join cardinalities
+        from the universe metadata instead of the number of joins.
+
+        The time spent and the number of candidate paths tried are recorded in
+        stats, which defaults to the stats of the universe.
         """
+        stats = self.stats if stats is None else stats
         sorted_nodes = sorted([[self.tables[node]['Priority'][0], node] for node in nodes])
+        with measure(stats, 'join_paths'):
+            if planner == 'greedy':
+                return self._greedy_paths(sorted_nodes, stats)
+            if planner == 'bfs':
+                return self._bfs_paths(sorted_nodes, stats)
+            if planner == 'steiner':
+                return self._steiner_paths(sorted_nodes, self.nearest_path, stats)
+            if planner == 'cost':
+                return self._steiner_paths(sorted_nodes, self.cheapest_path, stats)
+        raise ValueError('Unknown join planner: ' + str(planner))
+
+    def _greedy_paths(self, sorted_nodes, stats):
+        """
+        Greedy planner of join_paths.
+        """
         paths = []
 
-        paths.append(self.shortest_path(sorted_nodes[0][1], sorted_nodes[1][1]))
+        paths.append(self.shortest_path(sorted_nodes[0][1], sorted_nodes[1][1],
+                                        stats=stats))
+        increment(stats, 'candidate_paths')
         for next_node_index in range(len(sorted_nodes) - 2):
+            if paths[-1] is None:
+                return paths + [None] * (len(sorted_nodes) - 1 - len(paths))
             shortest = None
             flat_paths = [item for sublist in paths for item in sublist]
             old_path = len(flat_paths)
             for connected_path in flat_paths:
                 newpath = self.shortest_path(connected_path,
                                              sorted_nodes[next_node_index+2][1],
-                                             flat_paths)
+                                             flat_paths, stats)
+                increment(stats, 'candidate_paths')
                 if newpath:
                     if not shortest or len(newpath[old_path:]) < len(shortest):
                         shortest = newpath[old_path:]
             paths.append(shortest)
         return paths
 
+    def _bfs_paths(self, sorted_nodes, stats):
+        """
+        Multi-source search planner of join_paths.
+        """
+        paths = [self.shortest_path(sorted_nodes[0][1], sorted_nodes[1][1],
+                                    stats=stats)]
+        increment(stats, 'candidate_paths')
+        for _, node in sorted_nodes[2:]:
+            if paths[-1] is None:
+                return paths + [None] * (len(sorted_nodes) - 1 - len(paths))
+            flat_paths = [item for sublist in paths for item in sublist]
+            paths.append(self.nearest_path(flat_paths, {node}, stats))
+            increment(stats, 'candidate_paths')
+        return paths
+
+    def _steiner_paths(self, sorted_nodes, search, stats):
+        """
+        Steiner tree planner of join_paths (shortest path heuristic). search is
+        the multi-source search used to find the closest remaining node.
+        """
+        flat_paths = [sorted_nodes[0][1]]
+        remaining = [node for _, node in sorted_nodes[1:]]
+        paths = []
+        while remaining:
+            path = search(flat_paths, set(remaining), stats)
+            increment(stats, 'candidate_paths')
+            if path is None:
+                paths += [None] * len(remaining)
+                break
+            paths.append(path)
+            flat_paths += path
+            remaining.remove(path[-1])
+        return paths
 
-class Query(Universe):
+    @staticmethod
+    def bridge_tables(paths, nodes):
+        """
+        Returns the tables in paths that are not in nodes, in the order in which
+        they are first used. These are the tables that are implicitly added.
+        """
+        bridges = []
+        for path in paths:
+            for node in path or []:
+                if node not in nodes and node not in bridges:
+                    bridges.append(node)
+        return bridges
+
+    def compare_planners(self, nodes, planners=JOIN_PLANNERS):
+        """
+        Plans the joins for nodes with each of the planners and returns a
+        dictionary with the number of implicitly added tables per planner,
+        so the planners can be compared with the greedy one.
+        """
+        return {planner: len(self.bridge_tables(self.join_paths(nodes, planner), nodes))
+                for planner in planners}
+
+
+    def get_default_rows(self):
+        """
+        Row count assumed for tables without 'Rows' metadata: the median of the
+        known row counts, or 1 if none are known. Without any metadata every
+        join then costs the same and the cost planner counts joins.
+        """
+        known = sorted(self.tables[table]['Rows'][0]
+                       for table in self.tables
+                       if 'Rows' in self.tables[table])
+        if not known:
+            return 1
+        return known[len(known) // 2]
+
+    def table_rows(self, table):
+        """
+        Estimated number of rows of a table.
+        """
+        try:
+            return self.tables[table]['Rows'][0]
+        except KeyError:
+            return self.default_rows
+
+    def _join_metadata(self, key, table1, table2):
+        """
+        Looks up optional join metadata stored under key, on either of the two
+        tables. Returns None if it isn't specified.
+        """
+        for first, second in ((table1, table2), (table2, table1)):
+            try:
+                return self.tables[first][key][second][0]
+            except (KeyError, TypeError):
+                pass
+        return None
+
+    def is_foreign_key(self, table, referenced):
+        """
+        Whether the universe declares that every row of table references
+        exactly one row of referenced.
+        """
+        try:
+            return bool(self.tables[table]['ForeignKey'][referenced][0])
+        except (KeyError, TypeError, IndexError):
+            return False
+
+    def join_cardinality(self, table1, table2, table_rows=None):
+        """
+        Estimated number of rows produced by joining two tables. Uses the
+        'Cardinality' metadata if present, else the row counts multiplied by the
+        'Selectivity' of the join. Without a selectivity the join is assumed to
+        be on a key, producing as many rows as the larger table. table_rows
+        returns the row count of a table, by default Universe.table_rows.
+        """
+        cardinality = self._join_metadata('Cardinality', table1, table2)
+        if cardinality is not None:
+            return cardinality
+        if table_rows is None:
+            table_rows = self.table_rows
+        rows1 = table_rows(table1)
+        rows2 = table_rows(table2)
+        selectivity = self._join_metadata('Selectivity', table1, table2)
+        if selectivity is None:
+            return max(rows1, rows2)
+        return rows1 * rows2 * selectivity
+
+    def cheapest_path(self, sources, targets, stats=None):
+        """
+        Multi-source Dijkstra search, the weighted counterpart of nearest_path.
+        The weight of a join is its join_cardinality; among paths of equal cost
+        the one with the fewest joins wins. Returns the cheapest path from one
+        of the sources to one of the targets, or None.
+        """
+        stats = self.stats if stats is None else stats
+        ids = self.graph.ids
+        names = self.graph.names
+        path, expanded = self.graph.cheapest_path(
+            [ids[source] for source in sources if source in ids],
+            {ids[target] for target in targets if target in ids},
+            lambda node1, node2: self.join_cardinality(names[node1], names[node2]))
+        increment(stats, 'nodes_expanded', expanded)
+        if path is None:
+            return None
+        return self.table_names(path)
+
+    def order_joins(self, join_sets, outer=()):
+        """
+        Orders the joins of a join tree by estimated intermediate result size.
+        Joins in outer are outer joins, which can't be moved past other joins
+        without changing the result: they keep their place and orientation,
+        and only the runs of inner joins between them are reordered. The
+        first run is started from its table with the fewest rows, then the
+        join of the run that keeps the intermediate result smallest is added
+        each time. Returns the joins as tuples whose second entry is the
+        table being joined.
+        """
+        if not join_sets:
+            return []
+        runs = [[]]
+        for join in join_sets:
+            if join in outer:
+                runs += [join, []]
+            else:
+                runs[-1].append(join)
+        if runs[0]:
+            base_table = min({table for join in runs[0] for table in join},
+                             key=self.table_rows)
+        else:
+            base_table = join_sets[0][0]
+        joined = {base_table}
+        size = self.table_rows(base_table)
+        ordered = []
+        for run in runs:
+            if isinstance(run, tuple):
+                known, added = run if run[0] in joined else run[::-1]
+                size = (size * self.join_cardinality(known, added)
+                        / max(self.table_rows(known), 1))
+                joined.add(added)
+                ordered.append(run)
+                continue
+            remaining = list(run)
+            while remaining:
+                best = None
+                for join in remaining:
+                    if (join[0] in joined) == (join[1] in joined):
+                        continue
+                    known, added = join if join[0] in joined else join[::-1]
+                    new_size = (size * self.join_cardinality(known, added)
+                                / max(self.table_rows(known), 1))
+                    if best is None or new_size < best[0]:
+                        best = (new_size, join, (known, added))
+                if best is None:
+                    break
+                size, join, oriented = best
+                remaining.remove(join)
+                joined.add(oriented[1])
+                ordered.append(oriented)
+        return ordered
+
+def load_universe(filename, precompute_paths=False, use_cache=False,
+                  lazy_columns=False):
+    """
+    Returns the universe for filename from a process-wide registry, keyed by
+    the absolute path, so all queries on the same file share one Universe. The
+    file is loaded again only when its modification time or size changed, or
+    when a path index is requested that the registered universe doesn't have.
+    """
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _UNIVERSES_LOCK:
+        entry = _UNIVERSES.get(path)
+        if (entry is None or entry[0] != signature
+                or (precompute_paths and entry[1].next_hop is None)):
+            entry = (signature, Universe(path, precompute_paths, use_cache,
+                                         lazy_columns=lazy_columns))
+            _UNIVERSES[path] = entry
+        return entry[1]
+
+
+class CompileCache:
+    """
+    Bounded least-recently-used cache of compiled queries, keyed by the
+    fingerprint of a query. Counts hits and misses. Can be shared by several
+    queries, also from different threads.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value for key and marks it as recently used, or
+        None if it isn't cached.
+        """
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores value for key, evicting the least recently used entry when the
+        cache is full.
+        """
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class JoinTree:
+    """
+    A join tree that is kept up to date while tables are added and removed,
+    instead of being planned from scratch each time. Terminals are the tables
+    that were asked for, nodes all tables in the tree, including the bridge
+    tables, and edges the joins between them in the order they were added.
+    The path searches are counted in stats, if given.
+    """
+
+    def __init__(self, universe, stats=None):
+        self.universe = universe
+        self.stats = stats
+        self.terminals = []
+        self.nodes = []
+        self.edges = []
+
+    def add(self, table):
+        """
+        Adds a table as terminal. If it already is in the tree as a bridge
+        table nothing needs to be joined, otherwise only the path from the
+        closest table in the tree is attached. A table that can't be reached
+        is kept in the tree without joins.
+        """
+        if table in self.terminals:
+            return
+        self.terminals.append(table)
+        if table in self.nodes:
+            return
+        path = None
+        if self.nodes:
+            path = self.universe.nearest_path(self.nodes, {table}, self.stats)
+        if path is None:
+            self.nodes.append(table)
+            return
+        self.nodes += path[1:]
+        self.edges += list(zip(path[:-1], path[1:]))
+
+    def remove(self, table):
+        """
+        Removes a table as terminal, then prunes the bridge tables that are no
+        longer needed to connect the remaining terminals.
+        """
+        if table not in self.terminals:
+            return
+        self.terminals.remove(table)
+        pruned = True
+        while pruned:
+            pruned = False
+            for node in self.nodes:
+                if node in self.terminals:
+                    continue
+                node_edges = [edge for edge in self.edges if node in edge]
+                if len(node_edges) <= 1:
+                    self.nodes.remove(node)
+                    for edge in node_edges:
+                        self.edges.remove(edge)
+                    pruned = True
+                    break
+
+    def copy(self):
+        """
+        Copy of the tree on the same universe.
+        """
+        tree = JoinTree(self.universe, self.stats)
+        tree.terminals = list(self.terminals)
+        tree.nodes = list(self.nodes)
+        tree.edges = list(self.edges)
+        return tree
+
+    def bridge_tables(self):
+        """
+        Tables in the tree that are only there to connect the terminals.
+        """
+        return [node for node in self.nodes if node not in self.terminals]
+
+    def joins(self):
+        """
+        Returns the joins of the tree as tuples whose second entry is the table
+        being joined. The tree is walked from the terminal with the highest
+        priority, so the query starts from the same table as with join_paths.
+        """
+        if not self.terminals:
+            return []
+        tables = self.universe.tables
+        root = min(self.terminals,
+                   key=lambda table: (tables[table]['Priority'][0], table))
+        joined = {root}
+        remaining = list(self.edges)
+        ordered = []
+        while remaining:
+            for edge in remaining:
+                if edge[0] in joined or edge[1] in joined:
+                    break
+            else:
+                break
+            remaining.remove(edge)
+            if edge[0] not in joined:
+                edge = edge[::-1]
+            joined.add(edge[1])
+            ordered.append(edge)
+        return ordered
+
+
+class Query:
     """
     Query contains the functions that allow us to build an SQL query based on
-    a universe object. It maintains lists with the names of activated tables
+    a universe object. The universe is not copied: many queries can share one
+    loaded Universe, and a filename is looked up with load_universe. It
+    maintains lists with the names of activated tables
     and, if applicable, which of their columns in a dictionary. Implicit tables
     are tables that are called, only to bridge joins from one table to another.
     Since they are not explicitly called, we don't want their columns in the query.
     how_to_join is a dictionary that allows setting joins (left, right, inner, full)
-    other than the defaults imported from the JSON.
+    other than the defaults imported from the JSON. planner selects the
+    join_paths planner used by find_joins, or 'incremental' to keep a JoinTree
+    up to date as tables are added and removed. Compiled queries are kept in
+    compile_cache, which can be shared between queries. stats is an optional
+    stats.Stats object to record the time per phase of compiling and the
+    counters of planning; it defaults to the stats of the universe. dialect
+    and compact select how the query is written, see emit.Emitter. With
+    parameterize, literal values in where statements are compiled to
+    placeholders, see compile_parameterized. prune_joins and expand_star
+    enable the optimizations in optimize.py: leaving out joins that don't
+    change the result, and listing the columns of a table instead of '*'.
+    With prune_joins, tables without selected columns are only joined, not
+    selected, as soon as columns of any table are selected. The planner
+    'estimated' needs an estimator, see estimate.py and choose_planner.
     """
 
-    def __init__(self, filename):
-        super().__init__(filename)
+    def __init__(self, universe, precompute_paths=False, use_cache=False,
+                 compile_cache=None, stats=None):
+        if not isinstance(universe, Universe):
+            universe = load_universe(universe, precompute_paths, use_cache)
+        if compile_cache is None:
+            compile_cache = CompileCache()
+        if stats is None:
+            stats = universe.stats
+        self.universe = universe
+        self.compile_cache = compile_cache
+        self.stats = stats
         self.active_tables = []
         self.active_columns = {}
         self.active_presets = []
         self.implicit_tables = []
         self.how_to_join = {}
         self.where = {}
+        self.where_parameters = {}
+        self.parameterize = False
         self.tables_added_by_preset = []
+        self.planner = 'greedy'
+        self.join_tree = None
+        self.tree_changes = []
+        self.dialect = DEFAULT_DIALECT
+        self.compact = False
+        self.prune_joins = False
+        self.expand_star = False
+        self.estimator = None
+
+    @property
+    def tables(self):
+        """
+        The tables of the universe the query is built on.
+        """
+        return self.universe.tables
+
+    @property
+    def presets(self):
+        """
+        The presets of the universe the query is built on.
+        """
+        return self.universe.presets
 
     def add_tables(self, tablename):
         """
@@ -124,6 +772,10 @@ class Query(Universe):
         if tablename not in self.active_tables:
             self.active_tables.append(tablename)
             self.active_columns[tablename] = []
+        elif tablename in self.implicit_tables:
+            self.implicit_tables.remove(tablename)
+        if self.join_tree is not None:
+            self.tree_changes.append((tablename, True))
 
     def remove_tables(self, tablename):
         """
@@ -131,6 +783,10 @@ class Query(Universe):
         only valid names will be given.
         """
         self.active_tables.remove(tablename)
+        if tablename in self.implicit_tables:
+            self.implicit_tables.remove(tablename)
+        if self.join_tree is not None:
+            self.tree_changes.append((tablename, False))
 
     def add_columns(self, table, column):
         """
@@ -147,13 +803,20 @@ class Query(Universe):
         """
         self.active_columns[table].remove(column)
 
-    def add_where(self, string, table, column):
+    def add_where(self, string, table, column, parameters=None):
         """
         Adds any string to a list to be input as where statement. This could be
         vulnerable for SQL injection, but the scope of this project is in-house
         usage, and the generated SQL query isn't directly passed to the server.
+        Values that come from elsewhere can be passed as parameters instead, to
+        be bound to '?' placeholders in string; they are returned next to the
+        SQL by compile_parameterized.
         """
+        if parameters is None:
+            parameters = []
+        bind_parameters(string, parameters)
         self.where[(table, column)] = string
+        self.where_parameters[(table, column)] = list(parameters)
 
     def add_preset(self, preset):
         """
@@ -167,113 +830,569 @@ class Query(Universe):
         if table_to_add not in self.active_tables:
             self.add_tables(table_to_add)
             self.tables_added_by_preset.append(table_to_add)
-        self.add_where(relevant_preset['where'][0], table_to_add, column_to_add)
+        self.add_where(relevant_preset['where'][0], table_to_add, column_to_add,
+                       relevant_preset.get('parameters'))
         self.active_presets.append(preset)
 
+    def set_join(self, table1, table2, how):
+        """
+        Sets the way two tables are joined (inner, left, right, full), whichever
+        of the two tables the join is stored on in the universe.
+        """
+        table_tuple = (table1, table2)
+        if self._default_how(table_tuple) is None:
+            table_tuple = (table2, table1)
+        self.how_to_join[table_tuple] = how
+
+
+    def snapshot(self):
+        """
+        Copy of the selection of the query that shares its universe and
+        compile cache, so it can be planned and compiled on another thread
+        while this query keeps changing.
+        """
+        query = Query(self.universe, compile_cache=self.compile_cache, stats=self.stats)
+        query.restore(self)
+        return query
+
+    def restore(self, query):
+        """
+        Takes over the selection of another query on the same universe, such as
+        a snapshot after compiling it, including the tables it implicitly added
+        and the join settings it filled in.
+        """
+        self.active_tables = list(query.active_tables)
+        self.active_columns = {table: list(columns)
+                               for table, columns in query.active_columns.items()}
+        self.active_presets = list(query.active_presets)
+        self.implicit_tables = list(query.implicit_tables)
+        self.how_to_join = dict(query.how_to_join)
+        self.where = dict(query.where)
+        self.where_parameters = dict(query.where_parameters)
+        self.tables_added_by_preset = list(query.tables_added_by_preset)
+        self.planner = query.planner
+        self.dialect = query.dialect
+        self.compact = query.compact
+        self.parameterize = query.parameterize
+        self.prune_joins = query.prune_joins
+        self.expand_star = query.expand_star
+        self.estimator = query.estimator
+        self.join_tree = None if query.join_tree is None else query.join_tree.copy()
+        self.tree_changes = list(query.tree_changes)
 
-    def find_joins(self):
+    def freeze(self):
+        """
+        Returns the selection of the query as an immutable state.QueryState.
+        What compiling derived is left out: implicit tables, '*' for tables
+        without selected columns and join settings equal to the default.
+        """
+        explicit_tables = self.explicit_tables()
+        return QueryState(
+            explicit_tables,
+            {table: [column for column in self.active_columns[table] if column != '*']
+             for table in explicit_tables},
+            self.where,
+            self.where_parameters,
+            self.active_presets,
+            self.tables_added_by_preset,
+            {table_tuple: how for table_tuple, how in self.how_to_join.items()
+             if how != self._default_how(table_tuple)},
+            self.planner,
+            self.dialect,
+            self.compact,
+            self.parameterize,
+            self.prune_joins,
+            self.expand_star)
+
+    def thaw(self, state):
+        """
+        Replaces the selection of the query by an immutable state, see freeze.
+        """
+        self.active_tables = list(state.tables)
+        self.active_columns = {table: list(columns) for table, columns in state.columns.items()}
+        self.active_presets = list(state.presets)
+        self.implicit_tables = []
+        self.how_to_join = dict(state.how_to_join)
+        self.where = dict(state.where)
+        self.where_parameters = {key: list(values)
+                                 for key, values in state.where_parameters.items()}
+        self.tables_added_by_preset = list(state.tables_added_by_preset)
+        self.planner = state.planner
+        self.dialect = state.dialect
+        self.compact = state.compact
+        self.parameterize = state.parameterize
+        self.prune_joins = state.prune_joins
+        self.expand_star = state.expand_star
+        self.join_tree = None
+        self.tree_changes = []
+
+    def find_joins(self, planner=None):
         """
         Calls the join_paths function from Universe class. Figures out which joins
         are needed and which tables need to be implicitly added. Returns a list
-        of tuples with tablenames to be joined.
+        of tuples with tablenames to be joined. Unless a planner is given, the
+        planner set on the query is used. The cost planner also orders the joins
+        by estimated intermediate result size, so the query starts from the
+        most selective table; outer joins keep their place, see
+        Universe.order_joins. When the universe has a path index (see
+        precompute_paths), the paths are looked up instead of searched.
+        """
+        if planner is None:
+            planner = self.planner
+        with measure(self.stats, 'find_joins'):
+            join_sets = self._find_joins(planner)
+        increment(self.stats, 'joins_emitted', len(join_sets))
+        return join_sets
+
+    def _find_joins(self, planner):
+        """
+        Implementation of find_joins.
         """
+        explicit_tables = self.explicit_tables()
+        if planner == 'estimated':
+            if len(explicit_tables) < 2:
+                self.set_implicit_tables([])
+                return []
+            return self._find_joins(self.choose_planner())
+        if planner == 'incremental':
+            join_tree = self.get_join_tree()
+            self.set_implicit_tables(join_tree.bridge_tables())
+            join_sets = join_tree.joins()
+            if len(join_sets) < len(join_tree.nodes) - 1:
+                raise ValueError('tables {} can not all be joined in this universe'.format(
+                    ', '.join(explicit_tables)))
+            return join_sets
+        if len(explicit_tables) < 2:
+            self.set_implicit_tables([])
+            return []
         tags = [self.tables[table]['tag'][0]
-                for table in self.active_tables]
-        join_paths = self.join_paths(tags)
+                for table in explicit_tables]
+        join_paths = self.universe.join_paths(tags, planner, self.stats)
+        if None in join_paths:
+            raise ValueError('tables {} can not all be joined in this universe'.format(
+                ', '.join(explicit_tables)))
         join_sets = [(table1, table2)
                      for join_edge in join_paths
                      for table1, table2 in zip(join_edge[:-1], join_edge[1:])]
-        for sublist in join_paths:
-            for item in sublist:
-                if item not in self.active_tables:
-                    self.add_tables(item)
-                    self.implicit_tables.append(item)
+        if planner == 'cost':
+            outer = {join for join in join_sets
+                     if (self.join_how(join) or 'inner').lower() != 'inner'}
+            join_sets = self.universe.order_joins(join_sets, outer)
+        self.set_implicit_tables(self.universe.bridge_tables(join_paths, explicit_tables))
         return join_sets
 
+    def choose_planner(self, planners=ESTIMATED_PLANNERS):
+        """
+        Returns the planner of which the join tree has the lowest estimated
+        cost, according to the estimator of the query (see estimate.py).
+        Planners that can't join the tables are skipped.
+        """
+        if self.estimator is None:
+            raise ValueError("the 'estimated' planner needs an estimator")
+        costs = []
+        for position, planner in enumerate(planners):
+            query = self.snapshot()
+            query.planner = planner
+            try:
+                costs.append((self.estimator.estimate(query)['cost'], position, planner))
+            except ValueError:
+                continue
+        if not costs:
+            raise ValueError('tables {} can not all be joined in this universe'.format(
+                ', '.join(self.explicit_tables())))
+        return min(costs)[2]
+
+    def get_join_tree(self):
+        """
+        Returns the incrementally maintained JoinTree, building it from the
+        explicit tables the first time. From then on add_tables and
+        remove_tables record the tables toggled, and they are added to or
+        removed from the tree here, so toggling a table doesn't search the
+        graph; the GUI toggles tables on its own thread and plans on a
+        snapshot on the worker thread.
+        """
+        if self.join_tree is None:
+            self.join_tree = JoinTree(self.universe, self.stats)
+            for table in self.explicit_tables():
+                self.join_tree.add(table)
+        else:
+            for table, added in self.tree_changes:
+                if added:
+                    self.join_tree.add(table)
+                else:
+                    self.join_tree.remove(table)
+        self.tree_changes = []
+        return self.join_tree
+
+    def explicit_tables(self):
+        """
+        The active tables that were not implicitly added to bridge joins.
+        """
+        return [table for table in self.active_tables
+                if table not in self.implicit_tables]
+
+    def set_implicit_tables(self, tables):
+        """
+        Replaces the implicitly added tables by the given ones, so bridge tables
+        of earlier joins that are no longer needed don't pile up.
+        """
+        for table in self.implicit_tables:
+            self.active_tables.remove(table)
+        self.implicit_tables = []
+        for table in tables:
+            if table not in self.active_tables:
+                self.active_tables.append(table)
+                self.active_columns[table] = []
+                self.implicit_tables.append(table)
+
     def generate_join_statement(self, table_tuple):
         """
         Creates the join statement for a given tuple of tablenames. The second
         entry in the tuple is always the table that is joined. Since the string
         is stored in a dictionary with one specific combination of the two table
-        names, the try statement checks which way around it needs to be. how contains
+        names, the try statement checks which way around it needs to be. This can
+        either be a list of Joins (TypeError) or a dictionary in which the other
+        table is missing (KeyError). how contains
         the default way to join. Unless otherwise specified, this is used to generate
         the join string.
         """
-        added_table = table_tuple[1]
+        return self.emitter().emit_join(self.universe.handles,
+                                        *self.resolve_join(table_tuple))
+
+    def resolve_join(self, table_tuple):
+        """
+        Returns the joined table, the way to join it and the on string for a
+        tuple of tablenames, as used by generate_join_statement. When the
+        tuple is the reverse of the way the join is stored in the universe,
+        such as after the cost planner reordered the joins, a left join is
+        written as a right join and the other way around, so the same rows
+        are kept.
+        """
         try:
             on_string, how = self.tables[table_tuple[0]]['Joins'][table_tuple[1]]
-        except TypeError:
-            table_tuple = (table_tuple[1], table_tuple[0])
-            on_string, how = self.tables[table_tuple[0]]['Joins'][table_tuple[1]]
-
-
-        if table_tuple not in self.how_to_join:
-            self.how_to_join[table_tuple] = how
-
-        join_string = (self.how_to_join[table_tuple]
-                       + ' join '
-                       + self.tables[added_table]['DBHandle'][0]
-                       + ' '
-                       +  self.tables[added_table]['tag'][0]
-                       + '\n')
-        return join_string + on_string
+            stored_tuple = table_tuple
+        except (TypeError, KeyError):
+            stored_tuple = (table_tuple[1], table_tuple[0])
+            on_string, how = self.tables[stored_tuple[0]]['Joins'][stored_tuple[1]]
+        if stored_tuple not in self.how_to_join:
+            self.how_to_join[stored_tuple] = how
+        how = self.how_to_join[stored_tuple]
+        if stored_tuple != table_tuple:
+            how = FLIPPED_JOINS.get(how.lower(), how)
+        return table_tuple[1], how, on_string
 
     def generate_select_statement(self, table):
         """
         Creates the column specification. If no columns of an active table are
         specified, it assumes all the columns are wanted.
         """
+        return self.emitter().emit_columns(self.universe.handles,
+                                           [(table, self.selected_columns(table))])
+
+    def selected_columns(self, table):
+        """
+        The active columns of a table, set to ['*'] if none are specified.
+        """
         if not self.active_columns[table]:
             self.active_columns[table] = ['*']
-        return ',\n'.join([(self.tables[table]['tag'][0]
-                            + '.'
-                            + i)
-                           for i in self.active_columns[table]])
+        return self.active_columns[table]
 
+    def emitter(self):
+        """
+        The Emitter for the dialect and layout of the query.
+        """
+        return Emitter(self.dialect, self.compact)
+
+
+    def where_statements(self):
+        """
+        Returns the where statements as templates with '?' placeholders and
+        the list of values bound to them, in order. Without parameterize, only
+        the placeholders given to add_where are there and the rest of the where
+        statements is kept as is.
+        """
+        templates = []
+        values = []
+        for key, string in self.where.items():
+            template, where_values = bind_parameters(
+                string, self.where_parameters.get(key, []), self.parameterize)
+            templates.append(template)
+            values += where_values
+        return templates, values
+
+    def fingerprint(self):
+        """
+        Canonical description of everything the compiled query depends on. Any
+        change made through add_tables, remove_tables, add_columns,
+        remove_columns, add_where or add_preset changes the fingerprint, so
+        cached queries never need to be invalidated explicitly. Where statements
+        are taken as templates, so queries that only differ in the values
+        bound to their parameters share a compiled query. Selecting no
+        columns and selecting '*' are the same, and join settings that equal
+        the default of the universe are left out. Implicit tables are left out
+        too, since find_joins replaces them, but the shape of an incremental
+        join tree is not, nor the row counts an estimated planner chose with.
+        """
+        explicit_tables = self.explicit_tables()
+        columns = tuple((table, tuple(self.active_columns[table]) or ('*',))
+                        for table in explicit_tables)
+        joins = tuple(sorted((table_tuple, how)
+                             for table_tuple, how in self.how_to_join.items()
+                             if how != self._default_how(table_tuple)))
+        tree = None
+        if self.planner == 'incremental':
+            tree = tuple(self.get_join_tree().edges)
+        elif self.planner == 'estimated' and self.estimator is not None:
+            tree = (self.estimator.token, self.estimator.version)
+        return (self.universe.version,
+                tuple(explicit_tables),
+                columns,
+                joins,
+                tuple(zip(self.where, self.where_statements()[0])),
+                self.planner,
+                tree,
+                self.dialect,
+                self.compact,
+                self.parameterize,
+                self.prune_joins,
+                self.expand_star)
+
+    def join_how(self, table_tuple):
+        """
+        The way a tuple of tablenames is joined, in the orientation it is
+        stored in the universe: set with set_join, or else the default.
+        """
+        for stored_tuple in (table_tuple, (table_tuple[1], table_tuple[0])):
+            how = self._default_how(stored_tuple)
+            if how is not None:
+                return self.how_to_join.get(stored_tuple, how)
+        return None
+
+    def _default_how(self, table_tuple):
+        """
+        The default way to join a tuple of tablenames, as stored in the universe.
+        """
+        try:
+            return self.tables[table_tuple[0]]['Joins'][table_tuple[1]][1]
+        except (TypeError, KeyError, IndexError):
+            return None
 
     def compile_query(self):
+        """
+        Returns the compiled query from compile_cache if the same selection has
+        been compiled before, otherwise compiles it with _compile_query. The
+        tables that compiling implicitly added are stored with the query, so a
+        cache hit leaves the query in the same state as compiling it would.
+        """
+        with measure(self.stats, 'compile_query'):
+            return self._cached_compile_query()
+
+    def _cached_compile_query(self):
+        """
+        Implementation of compile_query.
+        """
+        key = self.fingerprint()
+        cached = self.compile_cache.get(key)
+        if cached is None:
+            increment(self.stats, 'compile_cache_misses')
+            query = self._compile_query()
+            self.compile_cache.put(key, (query, list(self.implicit_tables)))
+            return query
+        increment(self.stats, 'compile_cache_hits')
+        query, implicit_tables = cached
+        self.set_implicit_tables(implicit_tables)
+        for table in self.active_tables:
+            if table not in self.implicit_tables and not self.active_columns[table]:
+                self.active_columns[table] = ['*']
+        return query
+
+    def _compile_query(self):
         """
         Handles compilation of the query. If there are more than one activated
-        table, joins need to be handled. First the required joins are found, then
-        the strings that handle this are generated. The column statement is created.
-        If there is no where statement specified, '1=1' is added. The relevent
-        statements are added into the core query and returned.
+        table, joins need to be handled. First the required joins are found and
+        resolved to the way to join and the on string, then the selected columns
+        are collected. If enabled, the optimizations of optimize.py are applied
+        to those. The emitter writes it all out in one pass; if there is no
+        where statement specified, '1 = 1' is added.
         """
-        if len(self.active_tables) == 1:
+        joins = self.find_joins()
+        if not joins:
             base_table = self.active_tables[0]
-            join_statement = []
         else:
-            joins = self.find_joins()
             base_table = joins[0][0]
-            join_statement = [self.generate_join_statement(i) for i in joins]
-        join_statement = (['from '
-                           + self.tables[base_table]['DBHandle'][0]
-                           + ' '
-                           + self.tables[base_table]['tag'][0]]
-                          + join_statement)
-        completed_join_statement = '\n\n'.join(join_statement)
+        with measure(self.stats, 'join_statement'):
+            resolved_joins = [self.resolve_join(table_tuple) for table_tuple in joins]
+        with measure(self.stats, 'select_statement'):
+            columns = [(table, self.selected_columns(table))
+                       for table in self.active_tables
+                       if table not in self.implicit_tables]
+        emitter = self.emitter()
+        where, values = self.where_statements()
+        if self.prune_joins:
+            selected = [(table, table_columns) for table, table_columns in columns
+                        if table_columns != ['*']]
+            if selected:
+                columns = selected
+            required = {table for table, _ in columns}
+            required.update(table for table, _ in self.where)
+            required.add(base_table)
+            resolved_joins = prune_joins(self.universe, joins, resolved_joins,
+                                         required, where)
+        if self.expand_star:
+            columns = expand_star(self.universe, columns)
+        if values:
+            where = [emitter.placeholders(template) for template in where]
+        with measure(self.stats, 'emit'):
+            return emitter.emit(self.universe.handles, columns, base_table,
+                                resolved_joins, where)
 
+    def compile_parameterized(self):
+        """
+        Returns the compiled query and the list of values bound to its
+        placeholders, to be passed to the database driver as parameters.
+        """
+        query = self.compile_query()
+        return query, self.where_statements()[1]
 
-        column_statement = [self.generate_select_statement(table)
-                            for table in self.active_tables
-                            if table not in self.implicit_tables]
+def build_query(universe, spec, compile_cache=None):
+    """
+    Creates a Query from a declarative selection spec, a dictionary with the
+    optional keys:
+
+    tables: list of tablenames.
+    columns: dictionary of tablename to a list of columnnames.
+    where: list of dictionaries with 'table', 'column' and 'where' string, and
+    optionally the 'parameters' bound to placeholders in it.
+    presets: list of preset names.
+    joins: list of dictionaries with 'tables', a pair of tablenames, and
+    'how', the way to join them.
+    planner: the planner used by find_joins.
+    dialect: the SQL dialect to write, see emit.DIALECTS.
+    compact: whether to write the query on a single line.
+    parameterize: whether to compile literals in where statements to
+    parameters.
+    prune_joins, expand_star: whether to apply the optimizations of
+    optimize.py.
+    """
+    query = Query(universe, compile_cache=compile_cache)
+    if 'planner' in spec:
+        query.planner = spec['planner']
+    if 'dialect' in spec:
+        query.dialect = spec['dialect']
+    if 'compact' in spec:
+        query.compact = spec['compact']
+    if 'parameterize' in spec:
+        query.parameterize = spec['parameterize']
+    if 'prune_joins' in spec:
+        query.prune_joins = spec['prune_joins']
+    if 'expand_star' in spec:
+        query.expand_star = spec['expand_star']
+    for table in spec.get('tables', []):
+        query.add_tables(table)
+    for preset in spec.get('presets', []):
+        query.add_preset(preset)
+    for table, columns in spec.get('columns', {}).items():
+        query.add_tables(table)
+        for column in columns:
+            query.add_columns(table, column)
+    for where in spec.get('where', []):
+        query.add_where(where['where'], where['table'], where['column'],
+                        where.get('parameters'))
+    for join in spec.get('joins', []):
+        query.set_join(join['tables'][0], join['tables'][1], join['how'])
+    return query
 
 
+def compile_spec(universe, spec, compile_cache=None):
+    """
+    Compiles a single selection spec, see build_query.
+    """
+    return build_query(universe, spec, compile_cache).compile_query()
 
-        completed_column_statement = 'select\n\n' + ',\n'.join(column_statement)
 
+def compile_state(universe, state, compile_cache=None):
+    """
+    Compiles an immutable state.QueryState. The state isn't changed, so many
+    variants forked from one base state can be compiled independently.
+    """
+    query = Query(universe, compile_cache=compile_cache)
+    query.thaw(state)
+    return query.compile_query()
 
-        if self.where:
-            where_statement = '\nand '.join(self.where.values())
-        else:
-            where_statement = '1 = 1'
-        completed_where_statement = 'where ' + where_statement
 
-        query = '\n\n'.join([completed_column_statement,
-                             completed_join_statement,
-                             completed_where_statement])
+def compile_record(universe, spec, compile_cache=None):
+    """
+    Compiles a selection spec, or a JSON encoded one, into a result dictionary
+    with the 'sql' and the 'seconds' it took, and the 'parameters' bound to
+    its placeholders if there are any. Instead of raising, a spec that
+    can't be compiled gives a result with an 'error' message. The 'id' of the
+    spec, if any, is copied to the result.
+    """
+    start = time.perf_counter()
+    try:
+        if isinstance(spec, str):
+            spec = loads(spec)
+        query, parameters = build_query(universe, spec, compile_cache).compile_parameterized()
+        record = {'sql': query}
+        if parameters:
+            record['parameters'] = parameters
+    except (JSONDecodeError, LookupError, TypeError, ValueError, AttributeError) as error:
+        record = {'error': '{}: {}'.format(type(error).__name__, error)}
+    if isinstance(spec, dict) and 'id' in spec:
+        record['id'] = spec['id']
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+
+# Universe and cache of a worker process of compile_many.
+_WORKER = {}
+
+
+def _init_worker(universe_path, precompute_paths, use_cache):
+    """
+    Loads the universe once per worker process. With the fork start method
+    the registry already holds the universe loaded by the parent, so it is
+    shared instead of read again.
+    """
+    _WORKER['universe'] = load_universe(universe_path, precompute_paths, use_cache)
+    _WORKER['cache'] = CompileCache()
+
+
+def _compile_in_worker(compile_function, spec):
+    """
+    Compiles a spec against the universe of the worker process.
+    """
+    return compile_function(_WORKER['universe'], spec, _WORKER['cache'])
+
+
+def compile_many(universe_path, specs, processes=None, precompute_paths=False,
+                 use_cache=False, records=False):
+    """
+    Compiles an iterable of selection specs (see build_query) against one
+    universe, which is loaded once. Yields the compiled queries in the order
+    of the specs, as soon as they are available. With records, the results of
+    compile_record are yielded instead. With processes, the specs are
+    compiled in a pool of that many worker processes; only a limited number
+    of specs is handed out ahead of the results, so specs can be streamed in.
+    """
+    compile_function = compile_record if records else compile_spec
+    universe = load_universe(universe_path, precompute_paths, use_cache)
+    if not processes:
+        compile_cache = CompileCache()
+        for spec in specs:
+            yield compile_function(universe, spec, compile_cache)
+        return
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(universe.filename, precompute_paths,
+                                       use_cache)) as executor:
+        pending = deque()
+        for spec in specs:
+            pending.append(executor.submit(_compile_in_worker, compile_function, spec))
+            if len(pending) >= 4 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
-        return query
 
 def main():
     """
@@ -281,10 +1400,10 @@ def main():
     """
     file = 'example.JSON'
     query = Query(file)
-    query.addTables('table1')
-    query.addTables('table2')
-    query.addTables('table3')
-    print(query.compileQuery())
+    query.add_tables('table1')
+    query.add_tables('table2')
+    query.add_tables('table3')
+    print(query.compile_query())
 
 if __name__ == "__main__":
     main()
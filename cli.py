@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Headless command line interface. Reads selection specs as JSON Lines from
+stdin and writes one result per line to stdout, without starting Qt. Each
+record is handled as soon as it is read, so the command can sit in a pipeline.
+
+Example:
+    echo '{"tables": ["table1", "table2"]}' | python cli.py example.JSON
+"""
+
+import argparse
+import json
+import sys
+
+from classes import compile_many
+
+
+def compact_sql(sql):
+    """
+    Puts a compiled query on a single line by dropping blank lines and
+    joining the others with spaces.
+    """
+    return ' '.join(line for line in sql.splitlines() if line)
+
+
+def spec_lines(stream):
+    """
+    Yields the non-empty lines of stream as they come in.
+    """
+    for line in stream:
+        if line.strip():
+            yield line
+
+
+def parse_arguments(arguments=None):
+    """
+    Parses the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Compile SQL queries from JSON Lines selection specs on stdin.')
+    parser.add_argument('universe', help='universe file (.uni or .JSON)')
+    parser.add_argument('--format', choices=['sql', 'json'], default='sql',
+                        help='write one query per line (sql) or a JSON result '
+                             'with timing per line (json)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='compile in a pool of this many processes')
+    parser.add_argument('--precompute-paths', action='store_true',
+                        help='build the all-pairs path index at load')
+    parser.add_argument('--cache', action='store_true',
+                        help='use the compiled universe cache')
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None, stdin=None, stdout=None):
+    """
+    Runs the command line interface. Returns 1 if any spec failed to compile,
+    0 otherwise. In sql format, a failed spec gives an empty line on stdout
+    and the error on stderr.
+    """
+    options = parse_arguments(arguments)
+    stdin = sys.stdin if stdin is None else stdin
+    stdout = sys.stdout if stdout is None else stdout
+    failed = False
+    records = compile_many(options.universe, spec_lines(stdin),
+                           processes=options.processes,
+                           precompute_paths=options.precompute_paths,
+                           use_cache=options.cache, records=True)
+    for record in records:
+        if 'error' in record:
+            failed = True
+        if options.format == 'json':
+            stdout.write(json.dumps(record) + '\n')
+        elif 'error' in record:
+            sys.stderr.write(record['error'] + '\n')
+            stdout.write('\n')
+        else:
+            stdout.write(compact_sql(record['sql']) + '\n')
+        stdout.flush()
+    return int(failed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
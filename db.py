@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for DB-API connections to the database behind a universe, or to a
+SQLite stand-in of it (see standin.py): explaining a compiled query, and
+counting the rows of tables, exactly or from a sample, to estimate queries
+with (see estimate.py).
+"""
+
+import logging
+
+from emit import Emitter
+
+LOGGER = logging.getLogger(__name__)
+
+# How a query is explained per dialect: statements before, the prefix of the
+# query and statements after.
+EXPLAIN = {'sqlite': ([], 'explain query plan ', []),
+           'postgres': ([], 'explain ', []),
+           'sqlserver': (['set showplan_xml on'], '', ['set showplan_xml off'])}
+
+# Counting the rows of a sample of a table per dialect; SQLite has no
+# TABLESAMPLE.
+SAMPLED_COUNT = {'postgres': 'select count(*) from {table} tablesample system ({percent})',
+                 'sqlserver': 'select count(*) from {table} tablesample ({percent} percent)'}
+
+# Counting the rows of a table up to a limit per dialect.
+LIMITED_COUNT = {'postgres': 'select count(*) from (select 1 from {table} limit {limit}) as limited',
+                 'sqlite': 'select count(*) from (select 1 from {table} limit {limit}) as limited',
+                 'sqlserver': 'select count(*) from (select top {limit} 1 as one from {table}) as limited'}
+
+
+def explain(connection, sql, dialect='sqlite', parameters=()):
+    """
+    Runs the plan of sql, with the parameters bound to its placeholders, on a
+    DB-API connection and returns its rows as lists of strings. Raises the
+    error of the database driver if the query is invalid.
+    """
+    before, prefix, after = EXPLAIN[dialect]
+    cursor = connection.cursor()
+    try:
+        for statement in before:
+            cursor.execute(statement)
+        try:
+            cursor.execute(prefix + sql, parameters)
+            return [[str(value) for value in row] for row in cursor.fetchall()]
+        finally:
+            for statement in after:
+                cursor.execute(statement)
+    finally:
+        cursor.close()
+
+
+def count_statement(handle, dialect, percent=None, limit=None):
+    """
+    The statement counting the rows of the table with handle. With percent,
+    only that percentage of the table is sampled; with limit, counting stops
+    at limit rows.
+    """
+    table = Emitter(dialect).handle(handle)
+    if percent is not None:
+        if dialect not in SAMPLED_COUNT:
+            raise ValueError('the {} dialect has no TABLESAMPLE'.format(dialect))
+        return SAMPLED_COUNT[dialect].format(table=table, percent=percent)
+    if limit is not None:
+        return LIMITED_COUNT[dialect].format(table=table, limit=int(limit))
+    return 'select count(*) from ' + table
+
+
+def count_rows(connection, universe, tables=None, dialect='sqlserver', percent=None,
+               limit=None):
+    """
+    Counts the rows of tables (by default all tables of the universe) on a
+    DB-API connection, for the row_counts of an estimate.Estimator. Counting
+    every row of large tables is slow, so with percent a sample of that
+    percentage of every table is counted and scaled up, and with limit tables
+    are counted up to limit rows. Tables that can't be counted are logged and
+    left out; the failed statement is rolled back, so the other tables can
+    still be counted on databases that abort the transaction on an error.
+    """
+    row_counts = {}
+    cursor = connection.cursor()
+    try:
+        for table in universe.tables if tables is None else tables:
+            statement = count_statement(universe.tables[table]['DBHandle'][0], dialect,
+                                        percent, limit)
+            try:
+                cursor.execute(statement)
+                rows = cursor.fetchone()[0]
+            except Exception as error:  # pylint: disable=broad-except
+                LOGGER.warning('not counting the rows of %s: %s: %s',
+                               table, type(error).__name__, error)
+                connection.rollback()
+                continue
+            if percent is not None:
+                rows = rows * 100.0 / percent
+            row_counts[table] = rows
+    finally:
+        cursor.close()
+    return row_counts
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Emitting compiled queries as SQL text. Query decides which tables, columns,
+joins and where statements make up a query; an Emitter writes them out in one
+pass into a list of string parts that is joined once at the end, using the
+table handles and tags the universe resolved when it was loaded.
+
+A dialect decides how identifiers are quoted and how table handles are
+written. Handles and join conditions from the universe are written as they
+are, except that the sqlite dialect keeps only the schema and table of a
+handle, since SQLite has no database level. Column names that aren't plain
+identifiers are quoted for the dialect. The default layout puts a blank line
+between the clauses; the compact layout puts the whole query on one line.
+"""
+
+import re
+
+from params import render_placeholders
+
+DEFAULT_DIALECT = 'sqlserver'
+
+# Opening and closing quote of identifiers per dialect.
+DIALECTS = {'sqlserver': ('[', ']'),
+            'postgres': ('"', '"'),
+            'sqlite': ('"', '"')}
+
+# DB-API paramstyle of the usual driver per dialect: pyodbc, psycopg2 and
+# sqlite3.
+PARAMSTYLES = {'sqlserver': 'qmark',
+               'postgres': 'format',
+               'sqlite': 'qmark'}
+
+_PLAIN_IDENTIFIER = re.compile(r'^(\w+|\*)$')
+
+
+class Emitter:
+    """
+    Writes the parts of a query as SQL text for a dialect, see DIALECTS. With
+    compact, the query is written on a single line.
+    """
+
+    def __init__(self, dialect=DEFAULT_DIALECT, compact=False):
+        if dialect not in DIALECTS:
+            raise ValueError('unknown dialect {!r}, expected one of {}'.format(
+                dialect, ', '.join(sorted(DIALECTS))))
+        self.dialect = dialect
+        self.compact = compact
+        self.open_quote, self.close_quote = DIALECTS[dialect]
+        if compact:
+            self.clause_separator = ' '
+            self.column_separator = ', '
+            self.line_separator = ' '
+        else:
+            self.clause_separator = '\n\n'
+            self.column_separator = ',\n'
+            self.line_separator = '\n'
+
+    def column(self, name):
+        """
+        A column name, quoted if it isn't a plain identifier or '*'.
+        """
+        if _PLAIN_IDENTIFIER.match(name):
+            return name
+        return (self.open_quote
+                + name.replace(self.close_quote, self.close_quote * 2)
+                + self.close_quote)
+
+    def handle(self, handle):
+        """
+        A table handle from the universe as written in the dialect.
+        """
+        if self.dialect == 'sqlite':
+            return '.'.join(handle.split('.')[-2:])
+        return handle
+
+    def text(self, text):
+        """
+        A piece of SQL from the universe, such as a join condition, on one line
+        in the compact layout.
+        """
+        if self.compact and '\n' in text:
+            return ' '.join(line.strip() for line in text.splitlines() if line.strip())
+        return text
+
+    def placeholders(self, template):
+        """
+        A parameterized where statement with its placeholders written in the
+        paramstyle of the dialect, see params.py.
+        """
+        return render_placeholders(template, PARAMSTYLES[self.dialect])
+
+    def write_columns(self, parts, handles, columns):
+        """
+        Appends the select list to parts, see emit for columns.
+        """
+        first = True
+        for table, table_columns in columns:
+            tag = handles[table][1]
+            for name in table_columns:
+                if not first:
+                    parts.append(self.column_separator)
+                first = False
+                parts += [tag, '.', self.column(name)]
+
+    def write_join(self, parts, handles, table, how, on_string):
+        """
+        Appends the join of table to parts.
+        """
+        handle, tag = handles[table]
+        parts += [how, ' join ', self.handle(handle), ' ', tag,
+                  self.line_separator, self.text(on_string)]
+
+    def emit_columns(self, handles, columns):
+        """
+        Returns the select list on its own.
+        """
+        parts = []
+        self.write_columns(parts, handles, columns)
+        return ''.join(parts)
+
+    def emit_join(self, handles, table, how, on_string):
+        """
+        Returns the join statement of table on its own.
+        """
+        parts = []
+        self.write_join(parts, handles, table, how, on_string)
+        return ''.join(parts)
+
+    def emit(self, handles, columns, base_table, joins, where):
+        """
+        Returns the query text. handles maps tablenames to their (DBHandle,
+        tag); columns is a list of (tablename, list of columnnames) in select
+        order; joins is a list of (tablename, how, on_string) in join order;
+        where is a list of where statements, '1 = 1' is used if it is empty.
+        """
+        parts = ['select', self.clause_separator]
+        self.write_columns(parts, handles, columns)
+        handle, tag = handles[base_table]
+        parts += [self.clause_separator, 'from ', self.handle(handle), ' ', tag]
+        for table, how, on_string in joins:
+            parts.append(self.clause_separator)
+            self.write_join(parts, handles, table, how, on_string)
+        parts += [self.clause_separator, 'where ']
+        if where:
+            parts.append((self.line_separator + 'and ').join(
+                self.text(statement) for statement in where))
+        else:
+            parts.append('1 = 1')
+        return ''.join(parts)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Estimates of the cost and result size of compiled queries, from the plans a
+local engine makes for them. An Estimator builds a SQLite stand-in of the
+universe (see standin.py) and tells the SQLite planner how many rows every
+table has, from the row counts it is given, such as counts taken from the
+real database with db.count_rows, else the 'Rows' metadata of the universe.
+A query is compiled for SQLite and its EXPLAIN QUERY PLAN is scored:
+
+    SCAN table         reads every row, for every row of the tables before it
+    SEARCH table       an index lookup, log2(rows) per row before it
+    AUTOMATIC INDEX    building the index first costs rows * log2(rows)
+    TEMP B-TREE        sorting the rows so far
+
+and every table joined multiplies the rows so far by its fanout, given by
+the selectivity of its joins (see Universe.join_cardinality). Every where
+statement is assumed to keep WHERE_SELECTIVITY of the rows. If SQLite can't plan the query, the joins are
+scored in the order they are written, as if every join was a lookup.
+
+Estimates are cached per query fingerprint. Query.planner 'estimated' uses
+an estimator to choose the cheapest of the join trees of ESTIMATED_PLANNERS,
+see Query.choose_planner.
+"""
+
+import itertools
+import math
+import re
+import sqlite3
+import threading
+
+from classes import CompileCache
+from db import explain
+from standin import create_sqlite, set_row_counts
+
+WHERE_SELECTIVITY = 0.1
+
+_STEP = re.compile(r'(SCAN|SEARCH) (?:TABLE )?(\S+)')
+
+# Tokens of the estimators, which never repeat, unlike their id().
+_TOKENS = itertools.count()
+
+
+def log_rows(rows):
+    """
+    Cost of one lookup in an index over rows.
+    """
+    return math.log2(rows + 2)
+
+
+class Estimator:
+    """
+    Estimates queries on a universe, see the module docstring. row_counts
+    maps tablenames to numbers of rows and overrides the universe metadata;
+    cache_size is the number of estimates kept; version counts the updates of
+    the row counts. token identifies the estimator in query fingerprints. An
+    estimator can be shared by queries on several threads.
+    """
+
+    def __init__(self, universe, row_counts=None, cache_size=1024):
+        self.universe = universe
+        self.row_counts = {}
+        self.token = next(_TOKENS)
+        self.version = 0
+        self.cache = CompileCache(cache_size)
+        self.lock = threading.Lock()
+        self.connection = create_sqlite(universe)
+        self.tags = {universe.tables[table]['tag'][0]: table for table in universe.tables}
+        self.update_row_counts(row_counts or {})
+
+    def table_rows(self, table):
+        """
+        Number of rows assumed for a table.
+        """
+        if table in self.row_counts:
+            return self.row_counts[table]
+        return self.universe.table_rows(table)
+
+    def update_row_counts(self, row_counts):
+        """
+        Takes over new row counts, for instance after counting the rows of
+        the real database again, and forgets the estimates made before.
+        """
+        with self.lock:
+            self.row_counts.update(row_counts)
+            self.version += 1
+            set_row_counts(self.connection, self.universe,
+                           {table: self.table_rows(table) for table in self.universe.tables})
+            self.cache.clear()
+
+    def fanout(self, joined, table, joins):
+        """
+        Factor by which joining table to the tables joined so far multiplies
+        the number of rows: its row count times the selectivity of every join
+        between it and those tables, so a table SQLite joins last through
+        two joins is limited by both. The join cardinalities are taken from
+        the row counts of the estimator.
+        """
+        table_rows = self.table_rows(table)
+        fanout = table_rows
+        for table1, table2 in joins:
+            if table1 == table and table2 in joined:
+                other = table2
+            elif table2 == table and table1 in joined:
+                other = table1
+            else:
+                continue
+            fanout *= (self.universe.join_cardinality(other, table, self.table_rows)
+                       / max(self.table_rows(other) * table_rows, 1))
+        return fanout
+
+    def score(self, steps, joins, where_count):
+        """
+        Cost and result rows of a plan, given as a list of (operation, table,
+        detail) steps in the order SQLite runs them.
+        """
+        cost = 0.0
+        rows = 1.0
+        joined = []
+        for operation, table, detail in steps:
+            if operation == 'SORT':
+                cost += rows * log_rows(rows)
+                continue
+            table_rows = self.table_rows(table)
+            if operation == 'SCAN':
+                cost += rows * table_rows
+            else:
+                cost += rows * log_rows(table_rows)
+                if 'AUTOMATIC' in detail:
+                    cost += table_rows * log_rows(table_rows)
+            rows *= self.fanout(joined, table, joins)
+            joined.append(table)
+        return cost, rows * WHERE_SELECTIVITY ** where_count
+
+    def plan_steps(self, plan):
+        """
+        The steps of the rows of EXPLAIN QUERY PLAN, see score.
+        """
+        steps = []
+        for row in plan:
+            detail = row[-1]
+            if 'TEMP B-TREE' in detail:
+                steps.append(('SORT', None, detail))
+                continue
+            match = _STEP.match(detail)
+            if match and match.group(2) in self.tags:
+                steps.append((match.group(1), self.tags[match.group(2)], detail))
+        return steps
+
+    def estimate(self, query):
+        """
+        Returns the estimate of a query as a dictionary with the estimated
+        'cost' and result 'rows', and the 'plan' SQLite made, one line per
+        step. If SQLite couldn't plan it, 'error' holds the reason and the
+        estimate is taken from the join order of the query alone.
+        """
+        query = query.snapshot()
+        query.dialect = 'sqlite'
+        query.compact = True
+        key = query.fingerprint()
+        estimate = self.cache.get(key)
+        if estimate is not None:
+            return estimate
+        sql, parameters = query.compile_parameterized()
+        joins = query.find_joins()
+        where_count = len(query.where)
+        try:
+            with self.lock:
+                plan = explain(self.connection, sql, 'sqlite', parameters)
+            steps = self.plan_steps(plan)
+            estimate = {'plan': [row[-1] for row in plan]}
+        except sqlite3.Error as error:
+            base_table = joins[0][0] if joins else query.explicit_tables()[0]
+            steps = [('SCAN', base_table, '')]
+            steps += [('SEARCH', query.resolve_join(table_tuple)[0], '')
+                      for table_tuple in joins]
+            estimate = {'plan': [], 'error': str(error)}
+        estimate['cost'], estimate['rows'] = self.score(steps, joins, where_count)
+        self.cache.put(key, estimate)
+        return estimate
+
+    def close(self):
+        """
+        Closes the stand-in database.
+        """
+        self.connection.close()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Federation of several universes into one. Universes that share conformed
+dimension tables can be combined, so a single query can select tables from
+all of them. A federation is described by a JSON file:
+
+    {"members": {"marketing": "marketing.uni", "finance": "finance.uni"},
+     "links": [{"tables": ["marketing__customer", "finance__customer"],
+                "on": "on marketing__customer.id = finance__customer.id",
+                "how": "inner"}]}
+
+Every table of a member is named after the member and its own name, joined
+by NAMESPACE_SEPARATOR, and that name is also its tag, so tables with the same
+name in different members don't collide in the query. The join conditions and
+presets of a member are rewritten to the new tags when they are first used.
+links declare the joins between tables of different members.
+
+The members are loaded through load_universe, with their columns read lazily,
+so a member that is also used on its own, or in another federation, is
+loaded once and shared. The tables of a federation are views on the tables of
+its members; only the combined join graph is built anew. FederatedUniverse is
+a Universe, so queries and path planning work on it unchanged.
+"""
+
+import os
+import re
+from collections.abc import Mapping
+from hashlib import sha1
+from json import loads
+
+import pathindex
+from classes import Universe, load_universe
+from stats import measure
+
+NAMESPACE_SEPARATOR = '__'
+
+# Keys of a table that hold dictionaries keyed by the names of other tables.
+TABLE_KEYED = ('Joins', 'Selectivity', 'Cardinality', 'ForeignKey')
+
+
+def namespaced(member, table):
+    """
+    Name of a table of a member in the federation.
+    """
+    return member + NAMESPACE_SEPARATOR + table
+
+
+def retag(text, tags):
+    """
+    Rewrites the tags qualifying columns in a piece of SQL, such as
+    'table1.a', to the tags of the federation. tags maps old to new tags.
+    """
+    if not tags:
+        return text
+    pattern = re.compile(r'(?<![\w.])(' + '|'.join(map(re.escape, tags)) + r')\.')
+    return pattern.sub(lambda match: tags[match.group(1)] + '.', text)
+
+
+class FederatedTable(Mapping):
+    """
+    Read-only view on a table of a member universe. The tag and the keys
+    that refer to other tables are translated to the names of the federation,
+    and the joins declared by the federation are added; everything else, such
+    as the columns, is read from the member table as it is.
+    """
+
+    def __init__(self, federation, member, name, links):
+        self.federation = federation
+        self.member = member
+        self.name = name
+        self.table = federation.members[member].tables[name]
+        self.links = links
+        self.translated = {}
+
+    def translate(self, key):
+        """
+        The value of a key that refers to other tables, translated once.
+        """
+        if key not in self.translated:
+            tags = self.federation.member_tags[self.member]
+            value = self.table.get(key, {})
+            if not isinstance(value, dict):
+                value = {}
+            translated = {}
+            for other, entry in value.items():
+                if key == 'Joins':
+                    entry = [retag(entry[0], tags)] + list(entry[1:])
+                translated[namespaced(self.member, other)] = entry
+            if key == 'Joins':
+                translated.update(self.links)
+            self.translated[key] = translated
+        return self.translated[key]
+
+    def __getitem__(self, key):
+        if key == 'tag':
+            return [namespaced(self.member, self.name)]
+        if key in TABLE_KEYED and (key in self.table or key == 'Joins'):
+            return self.translate(key)
+        return self.table[key]
+
+    def __contains__(self, key):
+        return key == 'Joins' or key in self.table
+
+    def __iter__(self):
+        keys = list(self.table)
+        if 'Joins' not in keys:
+            keys.append('Joins')
+        return iter(keys)
+
+    def __len__(self):
+        return len(self.table) + ('Joins' not in self.table)
+
+
+class FederatedUniverse(Universe):
+    """
+    Universe combining the universes listed in a federation file, see the
+    module docstring. members maps member names to their Universe. With
+    precompute_paths, the path index of the combined graph is used like for
+    any universe (see pathindex.py).
+    """
+
+    def __init__(self, filename, precompute_paths=False, stats=None,
+                 lazy_columns=True, validate=False):
+        # Universe.__init__ reads a single universe file, so the attributes it
+        # sets are set here instead.
+        self.filename = filename
+        self.stats = stats
+        self.name_indexes = {}
+        with measure(stats, 'load'):
+            with open(filename, 'rb') as file:
+                contents = file.read()
+            federation = loads(contents.decode('utf-8'))
+            directory = os.path.dirname(os.path.abspath(filename))
+            self.members = {member: load_universe(os.path.join(directory, path),
+                                                  lazy_columns=lazy_columns)
+                            for member, path in federation['members'].items()}
+            self.member_tags = {member: {universe.tables[table]['tag'][0]:
+                                         namespaced(member, table)
+                                         for table in universe.tables}
+                                for member, universe in self.members.items()}
+            self.version = sha1(contents + ''.join(
+                universe.version for universe in self.members.values()).encode()).hexdigest()
+            self.links = self.read_links(federation.get('links', []))
+            self.tables = {namespaced(member, table):
+                           FederatedTable(self, member, table,
+                                          self.links.get(namespaced(member, table), {}))
+                           for member, universe in self.members.items()
+                           for table in universe.tables}
+            self.presets = self.federated_presets()
+            self.build_graph(validate)
+            if precompute_paths:
+                with measure(stats, 'path_index'):
+                    self.next_hop = pathindex.read_index(self)
+                    if self.next_hop is None:
+                        self.next_hop = self.build_path_index()
+
+    def read_links(self, links):
+        """
+        The declared joins between members, as Joins entries per table.
+        Raises a ValueError for links to unknown tables.
+        """
+        joins = {}
+        for link in links:
+            table1, table2 = link['tables']
+            for table in (table1, table2):
+                member, _, name = table.partition(NAMESPACE_SEPARATOR)
+                if member not in self.members or name not in self.members[member].tables:
+                    raise ValueError('link to unknown table ' + table)
+            joins.setdefault(table1, {})[table2] = [link['on'], link.get('how', 'inner')]
+        return joins
+
+    def federated_presets(self):
+        """
+        The presets of all members, named and rewritten like their tables.
+        """
+        presets = {}
+        for member, universe in self.members.items():
+            tags = self.member_tags[member]
+            for preset, properties in universe.presets.items():
+                properties = dict(properties)
+                if 'table' in properties:
+                    properties['table'] = [namespaced(member, properties['table'][0])]
+                if 'where' in properties:
+                    properties['where'] = [retag(properties['where'][0], tags)]
+                presets[namespaced(member, preset)] = properties
+        return presets
+
+    def get_edges(self):
+        """
+        The edges of the combined graph, taken from the graphs of the members
+        and the links, without translating the joins of every table.
+        """
+        edges = {}
+        for member, universe in self.members.items():
+            names = [namespaced(member, name) for name in universe.graph.names]
+            for node, name in enumerate(names):
+                edges[name] = [names[connected_node]
+                               for connected_node in universe.graph.neighbours(node)]
+        for table1, joins in self.links.items():
+            for table2 in joins:
+                if table2 not in edges[table1]:
+                    edges[table1].append(table2)
+                    edges[table2].append(table1)
+        return edges
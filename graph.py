@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Compact representation of the join graph of a universe. Tables are interned
+as integer ids and the adjacency is stored CSR-style in two arrays: the
+neighbours of node i are targets[offsets[i]:offsets[i + 1]], in the same order
+as in Universe.connections. The searches run on those arrays directly, so the
+graph holds no Python object per join, and the arrays are what gets pickled
+into the compiled cache. The searches here work on ids only; Universe
+translates between table names and ids.
+"""
+
+from array import array
+from collections import deque
+from heapq import heappop, heappush
+
+# Marks an unreachable node in a next-hop row.
+NO_PATH = -1
+
+
+class CompactGraph:
+    """
+    Join graph with integer table ids and array-backed adjacency. names maps
+    ids to table names and ids maps table names to ids.
+    """
+
+    def __init__(self, connections):
+        self.names = list(connections)
+        self.ids = {name: index for index, name in enumerate(self.names)}
+        self.offsets = array('l', [0])
+        self.targets = array('i')
+        for name in self.names:
+            self.targets.extend(self.ids[node] for node in connections[name])
+            self.offsets.append(len(self.targets))
+
+    def __len__(self):
+        return len(self.names)
+
+    def neighbours(self, node):
+        """
+        Ids of the nodes joined to node.
+        """
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    @staticmethod
+    def unwind(parents, end):
+        """
+        Follows the parent links back from end to a node without parent and
+        returns the path in forward order.
+        """
+        path = []
+        node = end
+        while node is not None:
+            path.append(node)
+            node = parents[node]
+        path.reverse()
+        return path
+
+    def nearest_path(self, sources, targets, excluded=()):
+        """
+        Breadth-first search from all sources at once, in the order given, to
+        the first node in targets that is reached. Nodes in excluded are not
+        visited. Returns the path and the number of nodes expanded; the path is
+        None if no target can be reached.
+        """
+        visited = bytearray(len(self.names))
+        for node in excluded:
+            visited[node] = 1
+        parents = {}
+        queue = deque()
+        for source in sources:
+            if source not in parents:
+                parents[source] = None
+                visited[source] = 1
+                queue.append(source)
+        for source in queue:
+            if source in targets:
+                return [source], 0
+        offsets = self.offsets
+        neighbour_ids = self.targets
+        expanded = 0
+        while queue:
+            node = queue.popleft()
+            expanded += 1
+            for connected_node in neighbour_ids[offsets[node]:offsets[node + 1]]:
+                if visited[connected_node]:
+                    continue
+                visited[connected_node] = 1
+                parents[connected_node] = node
+                if connected_node in targets:
+                    return self.unwind(parents, connected_node), expanded
+                queue.append(connected_node)
+        return None, expanded
+
+    def cheapest_path(self, sources, targets, weight):
+        """
+        Dijkstra search from all sources at once to the first node in targets
+        that is settled. weight(node1, node2) is the cost of a join; among
+        paths of equal cost the one with the fewest joins wins. Returns the
+        path, or None, and the number of nodes expanded.
+        """
+        parents = {}
+        costs = {}
+        heap = []
+        counter = 0
+        for source in sources:
+            if source not in costs:
+                parents[source] = None
+                costs[source] = (0, 0)
+                counter += 1
+                heappush(heap, (0, 0, counter, source))
+        done = set()
+        while heap:
+            cost, hops, _, node = heappop(heap)
+            if node in done:
+                continue
+            if node in targets:
+                return self.unwind(parents, node), len(done)
+            done.add(node)
+            for connected_node in self.neighbours(node):
+                if connected_node in done:
+                    continue
+                new_cost = (cost + weight(node, connected_node), hops + 1)
+                if connected_node not in costs or new_cost < costs[connected_node]:
+                    costs[connected_node] = new_cost
+                    parents[connected_node] = node
+                    counter += 1
+                    heappush(heap, new_cost + (counter, connected_node))
+        return None, len(done)
+
+    def next_hop_row(self, source):
+        """
+        Breadth-first search from source. Returns an array with, for every
+        node, the first node after source on the shortest path to it, or
+        NO_PATH if it can't be reached.
+        """
+        offsets = self.offsets
+        targets = self.targets
+        row = [NO_PATH] * len(self.names)
+        queue = deque()
+        for node in targets[offsets[source]:offsets[source + 1]]:
+            if node != source and row[node] == NO_PATH:
+                row[node] = node
+                queue.append(node)
+        while queue:
+            node = queue.popleft()
+            first_step = row[node]
+            for connected_node in targets[offsets[node]:offsets[node + 1]]:
+                if row[connected_node] == NO_PATH and connected_node != source:
+                    row[connected_node] = first_step
+                    queue.append(connected_node)
+        return array('i', row)
+
+    def next_hop_table(self):
+        """
+        Next-hop rows for all nodes, see next_hop_row.
+        """
+        return [self.next_hop_row(source) for source in range(len(self.names))]
+
+    @staticmethod
+    def indexed_path(next_hop, start, end):
+        """
+        Follows a next-hop table from start to end. Returns the path, or None if
+        end can't be reached.
+        """
+        path = [start]
+        node = start
+        while node != end:
+            node = next_hop[node][end]
+            if node == NO_PATH:
+                return None
+            path.append(node)
+        return path
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy loading of universes with very wide tables. The first load parses the
+JSON once and writes an indexed sidecar file next to it: a header with the
+presets and, per table, the keys needed for planning and emitting joins,
+followed by the remaining data of every table (such as 'Columns') as a
+separate pickle. Later loads only read the header; the rest of a table is
+read from the sidecar when it is first accessed. Like the compiled cache, the
+sidecar is rebuilt when the modification time or size of the universe file
+changes and its hash doesn't match anymore.
+
+The tables of one load read from the sidecar through a file handle that is
+opened with the header and kept open, so when the universe file changes and
+the sidecar is replaced, a universe loaded before keeps reading the data it
+was loaded with. On Windows a sidecar that is open can't be replaced; the
+changed universe is then loaded eagerly until the old one is released.
+"""
+
+import os
+import pickle
+import threading
+from collections.abc import Mapping
+from hashlib import sha1
+from json import loads
+
+from cache import read_header, source_state, write_file
+
+# Keys of a table that are loaded eagerly: everything needed for join planning
+# and for emitting the from and join statements.
+EAGER_KEYS = ('tag', 'DBHandle', 'Priority', 'Joins', 'Rows', 'Selectivity',
+              'Cardinality', 'ForeignKey')
+SIDECAR_FORMAT = 2
+SIDECAR_KEYS = ('mtime', 'size', 'version', 'presets', 'tables')
+SIDECAR_EXTENSION = '.idx'
+
+
+def sidecar_filename(filename):
+    """
+    Location of the sidecar belonging to a universe file.
+    """
+    return filename + SIDECAR_EXTENSION
+
+
+class SidecarFile:
+    """
+    Open sidecar, shared by the lazy tables of one load. Reads are serialized,
+    since they seek on the same file handle.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.lock = threading.Lock()
+
+    def read(self, offset, length):
+        """
+        Reads length bytes at offset.
+        """
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+
+class LazyTable(Mapping):
+    """
+    Read-only dictionary of a table whose eager keys are in memory, and whose
+    other keys are read from the sidecar (a SidecarFile) on first access.
+    """
+
+    def __init__(self, eager, keys, sidecar, offset, length):
+        self.eager = eager
+        self.key_list = keys
+        self.sidecar = sidecar
+        self.offset = offset
+        self.length = length
+        self.rest = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads the lazily loaded keys from the sidecar, once.
+        """
+        with self.lock:
+            if self.rest is None:
+                self.rest = pickle.loads(self.sidecar.read(self.offset, self.length))
+        return self.rest
+
+    def is_loaded(self):
+        """
+        Whether the lazily loaded keys have been read.
+        """
+        return self.rest is not None
+
+    def __getitem__(self, key):
+        if key in self.eager:
+            return self.eager[key]
+        if key not in self.key_list:
+            raise KeyError(key)
+        return self.load()[key]
+
+    def __contains__(self, key):
+        return key in self.key_list
+
+    def __iter__(self):
+        return iter(self.key_list)
+
+    def __len__(self):
+        return len(self.key_list)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['rest'] = self.load()
+        state['sidecar'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+def read_sidecar(filename):
+    """
+    Returns the version, presets and lazy tables from the sidecar of filename,
+    or None if there is no sidecar or it is outdated.
+    """
+    sidecar = sidecar_filename(filename)
+    try:
+        stat = os.stat(filename)
+        file = open(sidecar, 'rb')
+    except OSError:
+        return None
+    try:
+        header = read_header(file, SIDECAR_FORMAT, SIDECAR_KEYS)
+        current = None if header is None else source_state(header, filename, stat)
+        if current is None:
+            file.close()
+            return None
+        data_start = file.tell()
+        if current == 'touched':
+            header['mtime'] = stat.st_mtime_ns
+            header['size'] = stat.st_size
+            data = file.read()
+            try:
+                write_file(sidecar, header, data)
+            except OSError:
+                pass
+            else:
+                file.close()
+                return read_sidecar(filename)
+    except OSError:
+        file.close()
+        return None
+    sidecar_file = SidecarFile(file)
+    tables = {table: LazyTable(eager, keys, sidecar_file, data_start + offset, length)
+              for table, (eager, keys, offset, length) in header['tables'].items()}
+    return header['version'], header['presets'], tables
+
+
+def build_sidecar(filename):
+    """
+    Parses filename and writes its sidecar. Returns the version, presets and
+    tables as parsed from the JSON. Failing to write the sidecar isn't an
+    error.
+    """
+    stat = os.stat(filename)
+    with open(filename, 'rb') as file:
+        contents = file.read()
+    json = loads(contents.decode('utf-8'))
+    tables = {}
+    blobs = []
+    offset = 0
+    for table, properties in json['graph'].items():
+        eager = {key: value for key, value in properties.items() if key in EAGER_KEYS}
+        rest = {key: value for key, value in properties.items() if key not in EAGER_KEYS}
+        blob = pickle.dumps(rest, pickle.HIGHEST_PROTOCOL)
+        tables[table] = (eager, list(properties), offset, len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+    header = {'format': SIDECAR_FORMAT,
+              'mtime': stat.st_mtime_ns,
+              'size': stat.st_size,
+              'version': sha1(contents).hexdigest(),
+              'presets': json['presets'],
+              'tables': tables}
+    try:
+        write_file(sidecar_filename(filename), header, b''.join(blobs))
+    except OSError:
+        pass
+    return header['version'], json['presets'], json['graph']
+
+
+def load_tables(filename):
+    """
+    Returns the version, presets and lazily loaded tables of a universe file.
+    If the sidecar has to be built, the tables that were just parsed are
+    returned as they are. If the sidecar can't be written, e.g. on a read-only
+    share, the universe is simply loaded eagerly.
+    """
+    loaded = read_sidecar(filename)
+    if loaded is None:
+        loaded = build_sidecar(filename)
+    return loaded
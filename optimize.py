@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Optimizations between planning and emitting a query, both opt-in on Query.
+
+Join elimination drops joins that can't change the result. A join of a table
+can go when nothing is selected from it, no where statement or other join
+refers to it, nothing else is joined through it, and every row it is joined
+to matches exactly one of its rows: the universe declares a foreign key from
+the table it is joined to, many-to-one, with the 'ForeignKey' metadata:
+
+    "orders": {..., "Joins": {"customer": [...]},
+               "ForeignKey": {"customer": [true]}}
+
+says every row of orders references exactly one row of customer, so an
+inner or left join from orders to customer neither drops nor repeats rows of
+orders. Tables are removed from the leaves of the join tree inwards, so a
+chain of bridge tables can go entirely. With join elimination on, a table of which no
+columns are selected, while columns of other tables are, is only joined and
+not selected, so it can be eliminated too.
+
+Star expansion writes the 'Columns' of a table from the universe instead of
+'table.*' when no columns of it are selected.
+"""
+
+import re
+
+
+def mentions(text, tag):
+    """
+    Whether a piece of SQL refers to columns of the table with tag.
+    """
+    return re.search(r'(?<![\w.])' + re.escape(tag) + r'\.', text) is not None
+
+
+def prune_joins(universe, joins, resolved, required, where):
+    """
+    Returns the resolved joins (see Query.resolve_join) without the joins
+    that can be eliminated. joins are the planned tuples of tablenames, in
+    the same order as resolved; required are the tables that are selected or
+    otherwise needed, and where the where statements.
+    """
+    kept = list(zip(joins, resolved))
+    removed = True
+    while removed:
+        removed = False
+        parents = {table_tuple[0] for table_tuple, _ in kept}
+        for position, (table_tuple, (table, how, _)) in enumerate(kept):
+            if (table in required or table in parents
+                    or how.lower() not in ('inner', 'left')
+                    or not universe.is_foreign_key(table_tuple[0], table)):
+                continue
+            tag = universe.handles[table][1]
+            others = [join[2] for _, join in kept[:position] + kept[position + 1:]]
+            if any(mentions(text, tag) for text in others + list(where)):
+                continue
+            del kept[position]
+            removed = True
+            break
+    return [join for _, join in kept]
+
+
+def expand_star(universe, columns):
+    """
+    Replaces ['*'] in a list of (tablename, columns) by the 'Columns' of the
+    table in the universe, where the universe lists them.
+    """
+    expanded = []
+    for table, table_columns in columns:
+        if table_columns == ['*']:
+            table_columns = list(universe.tables[table].get('Columns') or table_columns)
+        expanded.append((table, table_columns))
+    return expanded
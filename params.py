@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Parameterized where statements. A where statement can contain '?'
+placeholders, bound to a list of values that is passed to the database next to
+the SQL instead of being written into it. Literal strings and numbers in a
+where statement can also be pulled out into parameters, so variants of a
+report that only differ in their values compile to the same statement, and
+the database can reuse its plan and the client its prepared statement.
+
+Placeholders are kept as '?' until the query is emitted, where they are
+written in the parameter style of the dialect (see emit.PARAMSTYLES).
+"""
+
+import re
+
+PLACEHOLDER = '?'
+
+# String literals (optionally N'' prefixed), quoted identifiers, placeholders
+# and numbers that aren't part of an identifier.
+_TOKENS = re.compile(r"""(N?'(?:[^']|'')*')"""
+                     r"""|("(?:[^"]|"")*"|\[[^\]]*\])"""
+                     r"""|(\?)"""
+                     r"""|((?<![\w.])\d+(?:\.\d+)?(?![\w.]))""")
+
+
+def literal_value(token):
+    """
+    The value of a string or number literal token.
+    """
+    if token.endswith("'"):
+        return token[token.index("'") + 1:-1].replace("''", "'")
+    if '.' in token:
+        return float(token)
+    return int(token)
+
+
+def bind_parameters(where, parameters=(), literals=False):
+    """
+    Returns the template and the values of a where statement. The '?'
+    placeholders in where are bound to parameters in order; with literals,
+    string and number literals are replaced by placeholders as well and their
+    values inserted in between. Raises a ValueError if the number of
+    placeholders doesn't match the number of parameters.
+    """
+    parameters = list(parameters)
+    values = []
+    parts = []
+    position = 0
+    used = 0
+    for match in _TOKENS.finditer(where):
+        literal, _, placeholder, number = match.groups()
+        if placeholder:
+            if used == len(parameters):
+                raise ValueError('more placeholders than parameters in {!r}'.format(where))
+            values.append(parameters[used])
+            used += 1
+        elif literals and (literal or number):
+            parts += [where[position:match.start()], PLACEHOLDER]
+            position = match.end()
+            values.append(literal_value(literal or number))
+    if used != len(parameters):
+        raise ValueError('{} parameters for {} placeholders in {!r}'.format(
+            len(parameters), used, where))
+    parts.append(where[position:])
+    return ''.join(parts), values
+
+
+def render_placeholders(template, paramstyle):
+    """
+    Writes the '?' placeholders of template in a DB-API paramstyle: 'qmark'
+    keeps them, 'format' writes '%s' and escapes the other '%' characters.
+    """
+    if paramstyle == 'qmark':
+        return template
+    template = template.replace('%', '%%')
+    return _TOKENS.sub(lambda match: '%s' if match.group(3) else match.group(0),
+                       template)
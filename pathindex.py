@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Persisted join-path index. For a universe that rarely changes, the shortest
+paths between all pairs of tables can be computed once, offline, and stored
+next to the universe file as its next-hop table (see
+Universe.build_path_index). The joins between two tables, as needed by
+generate_join_statement, follow from walking that table. The index records the
+version (SHA-1) of the universe contents and the table order it was built for
+in its header (see cache.write_file), and is ignored when either doesn't
+match or the index can't be read.
+
+Build the index with:
+    python pathindex.py universe.uni
+"""
+
+import sys
+
+from cache import read_header, read_payload, write_file
+
+INDEX_FORMAT = 2
+INDEX_EXTENSION = '.paths'
+
+
+def index_filename(filename):
+    """
+    Location of the path index belonging to a universe file.
+    """
+    return filename + INDEX_EXTENSION
+
+
+def read_index(universe):
+    """
+    Returns the stored next-hop table of universe, or None if there is no
+    index, it was built for other universe contents or it can't be read.
+    """
+    try:
+        with open(index_filename(universe.filename), 'rb') as file:
+            header = read_header(file, INDEX_FORMAT, ('version', 'names'))
+            if (header is None
+                    or header['version'] != universe.version
+                    or header['names'] != universe.graph.names):
+                return None
+            return read_payload(file)
+    except OSError:
+        return None
+
+
+def write_index(universe):
+    """
+    Stores the next-hop table of universe next to its file, building the
+    table first if the universe doesn't have one. Returns the filename.
+    """
+    next_hop = universe.next_hop
+    if next_hop is None:
+        next_hop = universe.build_path_index()
+    header = {'format': INDEX_FORMAT,
+              'version': universe.version,
+              'names': universe.graph.names}
+    filename = index_filename(universe.filename)
+    write_file(filename, header, next_hop)
+    return filename
+
+
+def main(arguments=None):
+    """
+    Builds the path index of the universe files given on the command line.
+    """
+    from classes import Universe
+    for filename in sys.argv[1:] if arguments is None else arguments:
+        print(write_index(Universe(filename)))
+
+
+if __name__ == '__main__':
+    main()
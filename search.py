@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Search index over column names. The column picker of the GUI filters the
+columns of a table as the user types; on tables with thousands of columns
+scanning and sorting all names on every keystroke is too slow, so every list
+of names gets a NameIndex, built once. Universe keeps the indexes
+(see Universe.column_index), building the index of a table the first time it
+is searched.
+
+Matching ignores case. A search intersects the positions of the trigrams of
+the search text and only checks the remaining candidates; search texts shorter
+than a trigram check every name.
+"""
+
+from array import array
+
+
+def trigrams(text):
+    """
+    The distinct three-character pieces of text.
+    """
+    return {text[start:start + 3] for start in range(len(text) - 2)}
+
+
+class NameIndex:
+    """
+    Substring index over a list of names. names holds the names in sorted
+    order; searches return the matches in that order.
+    """
+
+    def __init__(self, names):
+        self.names = sorted(names)
+        self.lowered = [name.lower() for name in self.names]
+        postings = {}
+        for position, name in enumerate(self.lowered):
+            for trigram in trigrams(name):
+                postings.setdefault(trigram, array('i')).append(position)
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, text, limit=None):
+        """
+        Names that contain text, all names if text is empty.
+        """
+        text = text.lower()
+        if len(text) < 3:
+            candidates = range(len(self.names))
+        else:
+            lists = []
+            for trigram in trigrams(text):
+                if trigram not in self.postings:
+                    return []
+                lists.append(self.postings[trigram])
+            lists.sort(key=len)
+            candidates = set(lists[0])
+            for positions in lists[1:]:
+                candidates.intersection_update(positions)
+            candidates = sorted(candidates)
+        matches = []
+        for position in candidates:
+            if text in self.lowered[position]:
+                matches.append(self.names[position])
+                if len(matches) == limit:
+                    break
+        return matches
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Asynchronous query-building service. Clients connect over TCP or a local
+(Unix) socket and send selection specs as JSON Lines, as accepted by
+classes.build_query; every line is answered with one JSON line holding the
+compiled SQL, as returned by classes.compile_record. Requests are compiled
+concurrently against one shared universe, and answered in the order they
+were sent on a connection.
+
+Optionally the SQL is validated by running EXPLAIN through a pool of
+database connections. For local testing the pool can be filled with SQLite
+stand-ins (see standin.py):
+
+    python service.py example.JSON --port 8765 --validate-sqlite
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from classes import CompileCache, Universe, compile_record, load_universe
+from db import explain
+from emit import DEFAULT_DIALECT
+from standin import create_sqlite
+from watch import UniverseWatcher
+
+class ConnectionPool:
+    """
+    Fixed-size pool of database connections for validating queries. connect
+    is called without arguments to open a connection; connections are opened
+    when first needed. Every connection is used by one thread at a time.
+    """
+
+    def __init__(self, connect, size=4, dialect='sqlite'):
+        self.connect = connect
+        self.size = size
+        self.dialect = dialect
+        self.opened = 0
+        self.idle = None
+
+    async def acquire(self, executor=None):
+        """
+        Returns an idle connection, opening one in executor if the pool isn't
+        full yet, or waits for one to be released. If opening fails, the error
+        is raised and a waiting request gets to try opening one instead.
+        """
+        if self.idle is None:
+            self.idle = asyncio.Queue()
+        while True:
+            if self.idle.empty() and self.opened < self.size:
+                self.opened += 1
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        executor, self.connect)
+                except BaseException:
+                    self.opened -= 1
+                    self.idle.put_nowait(None)
+                    raise
+            connection = await self.idle.get()
+            if connection is not None:
+                return connection
+
+    def release(self, connection):
+        """
+        Returns a connection to the pool.
+        """
+        self.idle.put_nowait(connection)
+
+    async def validate(self, sql, executor, parameters=()):
+        """
+        Explains sql with its parameters on a pooled connection in executor.
+        Returns a dictionary with 'valid' and either the 'plan' or the
+        'validation_error', also when no connection could be opened.
+        """
+        try:
+            connection = await self.acquire(executor)
+        except Exception as error:  # pylint: disable=broad-except
+            return {'valid': False,
+                    'validation_error': '{}: {}'.format(type(error).__name__, error)}
+        try:
+            plan = await asyncio.get_running_loop().run_in_executor(
+                executor, explain, connection, sql, self.dialect, parameters)
+        except Exception as error:  # pylint: disable=broad-except
+            return {'valid': False,
+                    'validation_error': '{}: {}'.format(type(error).__name__, error)}
+        finally:
+            self.release(connection)
+        return {'valid': True, 'plan': plan}
+
+
+class QueryService:
+    """
+    Compiles selection specs concurrently against one shared universe, in a
+    thread pool of workers threads, and optionally validates the result with
+    a ConnectionPool. The latency of the last requests is kept to report
+    percentiles; a client gets the statistics by sending {"stats": true}
+    instead of a spec. With watch_interval, the universe file is checked for
+    changes that often and reloaded in the background (see watch.py); every
+    request is compiled against the universe current when it came in. At
+    most max_pending requests of one connection are compiled or waiting to be
+    answered at a time; reading from the client pauses until one is answered.
+    """
+
+    def __init__(self, universe, pool=None, workers=None, cache_size=1024,
+                 watch_interval=None, max_pending=64):
+        if not isinstance(universe, Universe):
+            universe = load_universe(universe)
+        self.universe = universe
+        self.watcher = None
+        if watch_interval is not None:
+            self.watcher = UniverseWatcher(universe, watch_interval,
+                                           precompute_paths=universe.next_hop is not None,
+                                           on_reload=self.reloaded)
+            self.watcher.start()
+        self.pool = pool
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(workers)
+        self.compile_cache = CompileCache(cache_size)
+        self.latencies = deque(maxlen=10000)
+        self.requests = 0
+        self.started = time.perf_counter()
+
+    def reloaded(self, universe, _):
+        """
+        Swaps in a reloaded universe.
+        """
+        self.universe = universe
+
+    async def handle_spec(self, spec):
+        """
+        Compiles one spec, given as a dictionary or a JSON line, and validates
+        it if there is a pool, compiled in the dialect of the pool. Returns the result record, or the statistics
+        for a stats request.
+        """
+        if isinstance(spec, str):
+            try:
+                spec = json.loads(spec)
+            except ValueError:
+                pass
+        if isinstance(spec, dict) and spec.get('stats'):
+            return self.statistics()
+        start = time.perf_counter()
+        universe = self.universe
+        loop = asyncio.get_running_loop()
+        record = await loop.run_in_executor(
+            self.executor, compile_record, universe, spec, self.compile_cache)
+        if self.pool is not None and 'sql' in record:
+            validated = record
+            if spec.get('dialect', DEFAULT_DIALECT) != self.pool.dialect:
+                # The pool only understands its own dialect, so a copy of the
+                # query is compiled in that dialect to be validated.
+                validated = await loop.run_in_executor(
+                    self.executor, compile_record, universe,
+                    dict(spec, dialect=self.pool.dialect), self.compile_cache)
+            record.update(await self.pool.validate(validated['sql'], self.executor,
+                                                  validated.get('parameters', ())))
+        self.latencies.append(time.perf_counter() - start)
+        self.requests += 1
+        return record
+
+    async def handle_connection(self, reader, writer):
+        """
+        Reads JSON Lines specs from a client and writes the records back in
+        the order of the requests, while up to max_pending later requests are
+        already being compiled.
+        """
+        pending = asyncio.Queue(maxsize=self.max_pending)
+
+        async def respond():
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                writer.write((json.dumps(await task) + '\n').encode('utf-8'))
+                await writer.drain()
+
+        responder = asyncio.ensure_future(respond())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode('utf-8')
+                if line.strip():
+                    await pending.put(asyncio.ensure_future(self.handle_spec(line)))
+            await pending.put(None)
+            await responder
+        finally:
+            responder.cancel()
+            writer.close()
+
+    def percentiles(self, percentages=(50, 90, 99)):
+        """
+        Latency in seconds at the given percentages over the last requests.
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {}
+        return {percentage: latencies[min(len(latencies) - 1,
+                                          len(latencies) * percentage // 100)]
+                for percentage in percentages}
+
+    def statistics(self):
+        """
+        The number of requests answered, the seconds since the service
+        started, the throughput in requests per second and the latency
+        percentiles in seconds.
+        """
+        seconds = time.perf_counter() - self.started
+        return {'requests': self.requests,
+                'seconds': seconds,
+                'requests_per_second': self.requests / seconds if seconds else 0.0,
+                'latency': {'p{}'.format(percentage): latency
+                            for percentage, latency in self.percentiles().items()}}
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        """
+        Starts listening on a Unix socket at path, or else on host and port.
+        Returns the asyncio server.
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+def parse_arguments(arguments=None):
+    """
+    Parses the command line.
+    """
+    parser = argparse.ArgumentParser(description='Serve the SQL builder.')
+    parser.add_argument('universe', help='universe file (.uni or .JSON)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help='listen on this Unix socket instead')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='threads compiling and validating queries')
+    parser.add_argument('--validate-sqlite', action='store_true',
+                        help='validate queries against SQLite stand-ins')
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help='requests per connection compiled ahead of the answers')
+    parser.add_argument('--watch', type=float, default=None, metavar='SECONDS',
+                        help='reload the universe when its file changes, '
+                             'checking every SECONDS')
+    return parser.parse_args(arguments)
+
+
+async def serve(options):
+    """
+    Runs the service until it is cancelled, then writes its statistics to
+    stderr.
+    """
+    service = QueryService(options.universe, workers=options.workers,
+                           watch_interval=options.watch, max_pending=options.max_pending)
+    if options.validate_sqlite:
+        # Stand-ins opened after a reload have the tables of the new universe.
+        service.pool = ConnectionPool(lambda: create_sqlite(service.universe),
+                                      options.pool_size)
+    server = await service.start(options.host, options.port, options.socket)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(json.dumps(service.statistics()), file=sys.stderr)
+
+
+def main(arguments=None):
+    """
+    Starts the service from the command line.
+    """
+    asyncio.run(serve(parse_arguments(arguments)))
+
+
+if __name__ == '__main__':
+    main()
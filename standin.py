@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Local SQLite stand-in for the database behind a universe. Every table of the
+universe is created, without rows, under its DBHandle with its Columns, so
+compiled queries can be checked with EXPLAIN without a connection to the
+real server. Schema-qualified handles like 'tables.table1' are created in an
+attached in-memory database named after the schema.
+"""
+
+import sqlite3
+
+
+def quote(name):
+    """
+    Quotes an identifier for SQLite.
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def split_handle(handle):
+    """
+    Splits a DBHandle in schema (or None) and table name. Only the last two
+    parts are used, since SQLite has no database level above the schema.
+    """
+    parts = handle.split('.')
+    if len(parts) == 1:
+        return None, parts[0]
+    return parts[-2], parts[-1]
+
+
+def create_sqlite(universe, database=':memory:'):
+    """
+    Returns a sqlite3 connection with the tables of universe created. The
+    connection can be used from other threads than the one creating it, as
+    long as it is used by one thread at a time.
+    """
+    connection = sqlite3.connect(database, check_same_thread=False)
+    schemas = set()
+    for table in universe.tables.values():
+        schema, name = split_handle(table['DBHandle'][0])
+        if schema is not None and schema not in schemas:
+            connection.execute('attach database ? as ' + quote(schema), (':memory:',))
+            schemas.add(schema)
+        columns = ', '.join(quote(column) for column in table.get('Columns', []))
+        qualified = quote(name) if schema is None else quote(schema) + '.' + quote(name)
+        connection.execute('create table if not exists {} ({})'.format(
+            qualified, columns or '"_"'))
+    connection.commit()
+    return connection
+
+
+def set_row_counts(connection, universe, row_counts):
+    """
+    Makes the SQLite planner assume the given number of rows per table,
+    through sqlite_stat1, though the stand-in tables are empty. row_counts
+    maps tablenames of the universe to row counts.
+    """
+    schemas = {}
+    for table, rows in row_counts.items():
+        schema, name = split_handle(universe.tables[table]['DBHandle'][0])
+        schemas.setdefault(schema or 'main', []).append((name, str(max(int(rows), 1))))
+    for schema, counts in schemas.items():
+        connection.execute('analyze ' + quote(schema))
+        statistics = quote(schema) + '.sqlite_stat1'
+        connection.execute('delete from {} where idx is null'.format(statistics))
+        connection.executemany(
+            'insert into {} (tbl, idx, stat) values (?, null, ?)'.format(statistics), counts)
+        connection.execute('analyze {}.sqlite_master'.format(quote(schema)))
+    connection.commit()
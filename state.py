@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Immutable query states. A QueryState holds the selection of a query (the
+tables, columns, where statements, presets and join settings that were asked
+for) in tuples and read-only dictionaries. Changing it returns a new state
+that shares everything that didn't change with the old one, so forking a
+state is free and many variants of one base query can be kept side by side.
+What compiling derives from the selection, the implicitly added bridge tables
+and '*' for tables without columns, is not part of the state, so compiling a
+state can't change it.
+
+Query.freeze returns the state of a query and Query.thaw takes one over; see
+classes.compile_state to compile a state directly. diff lists the changes
+between two states and apply_diff replays them, and History keeps the states
+of a query for undo and redo.
+"""
+
+from types import MappingProxyType
+
+from params import bind_parameters
+
+EMPTY = MappingProxyType({})
+
+
+def _set(mapping, key, value):
+    """
+    Read-only copy of mapping with key set to value. The values themselves
+    are shared.
+    """
+    changed = dict(mapping)
+    changed[key] = value
+    return MappingProxyType(changed)
+
+
+def _delete(mapping, key):
+    """
+    Read-only copy of mapping without key.
+    """
+    changed = dict(mapping)
+    del changed[key]
+    return MappingProxyType(changed)
+
+
+class QueryState:
+    """
+    Immutable selection of a query. tables are the explicitly selected tables
+    in order; columns maps tables to a tuple of their selected columns (empty
+    for all columns); where maps (table, column) to a where statement and
+    where_parameters to the values bound to it; how_to_join maps pairs of
+    tables, in the orientation they are stored in the universe, to the way
+    they are joined. The methods named like those of Query return a changed
+    state; the ones that need the joins or presets of the universe take it as
+    their last argument.
+    """
+
+    __slots__ = ('tables', 'columns', 'where', 'where_parameters', 'presets',
+                 'tables_added_by_preset', 'how_to_join', 'planner', 'dialect',
+                 'compact', 'parameterize', 'prune_joins', 'expand_star')
+
+    def __init__(self, tables=(), columns=EMPTY, where=EMPTY, where_parameters=EMPTY,
+                 presets=(), tables_added_by_preset=(), how_to_join=EMPTY,
+                 planner='greedy', dialect='sqlserver', compact=False,
+                 parameterize=False, prune_joins=False, expand_star=False):
+        set_attribute = object.__setattr__
+        set_attribute(self, 'tables', tuple(tables))
+        set_attribute(self, 'columns', MappingProxyType(
+            {table: tuple(columns.get(table, ())) for table in self.tables}))
+        set_attribute(self, 'where', MappingProxyType(dict(where)))
+        set_attribute(self, 'where_parameters', MappingProxyType(
+            {key: tuple(values) for key, values in where_parameters.items()}))
+        set_attribute(self, 'presets', tuple(presets))
+        set_attribute(self, 'tables_added_by_preset', tuple(tables_added_by_preset))
+        set_attribute(self, 'how_to_join', MappingProxyType(dict(how_to_join)))
+        set_attribute(self, 'planner', planner)
+        set_attribute(self, 'dialect', dialect)
+        set_attribute(self, 'compact', compact)
+        set_attribute(self, 'parameterize', parameterize)
+        set_attribute(self, 'prune_joins', prune_joins)
+        set_attribute(self, 'expand_star', expand_star)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('QueryState is immutable')
+
+    def replace(self, **changes):
+        """
+        Copy of the state with some attributes replaced. The attributes that
+        aren't replaced are shared, not copied.
+        """
+        state = object.__new__(QueryState)
+        for name in self.__slots__:
+            object.__setattr__(state, name, changes.get(name, getattr(self, name)))
+        return state
+
+    def as_tuple(self):
+        """
+        The attributes of the state, with the dictionaries as sorted tuples of
+        items.
+        """
+        return tuple(tuple(sorted(value.items())) if isinstance(value, MappingProxyType)
+                     else value
+                     for value in (getattr(self, name) for name in self.__slots__))
+
+    def __eq__(self, other):
+        return isinstance(other, QueryState) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return 'QueryState(tables={!r})'.format(self.tables)
+
+    def add_tables(self, table):
+        """
+        State with table selected.
+        """
+        if table in self.tables:
+            return self
+        return self.replace(tables=self.tables + (table,),
+                            columns=_set(self.columns, table, ()))
+
+    def remove_tables(self, table):
+        """
+        State without table.
+        """
+        if table not in self.tables:
+            return self
+        return self.replace(tables=tuple(name for name in self.tables if name != table),
+                            columns=_delete(self.columns, table))
+
+    def add_columns(self, table, column):
+        """
+        State with column of table selected; table has to be selected.
+        """
+        if column in self.columns[table]:
+            return self
+        return self.replace(columns=_set(self.columns, table, self.columns[table] + (column,)))
+
+    def remove_columns(self, table, column):
+        """
+        State without column of table.
+        """
+        return self.replace(columns=_set(
+            self.columns, table, tuple(name for name in self.columns[table] if name != column)))
+
+    def add_where(self, string, table, column, parameters=()):
+        """
+        State with a where statement on column of table. Raises a ValueError
+        if the number of '?' placeholders in string doesn't match parameters.
+        """
+        key = (table, column)
+        bind_parameters(string, parameters)
+        return self.replace(where=_set(self.where, key, string),
+                            where_parameters=_set(self.where_parameters, key, tuple(parameters)))
+
+    def add_preset(self, preset, universe):
+        """
+        State with a preset of universe added: its table is selected, if it
+        wasn't yet, and its where statement is added.
+        """
+        relevant_preset = universe.presets[preset]
+        table_to_add = relevant_preset['table'][0]
+        state = self
+        if table_to_add not in self.tables:
+            state = state.add_tables(table_to_add).replace(
+                tables_added_by_preset=self.tables_added_by_preset + (table_to_add,))
+        state = state.add_where(relevant_preset['where'][0], table_to_add,
+                                relevant_preset['column'][0],
+                                relevant_preset.get('parameters') or ())
+        return state.replace(presets=self.presets + (preset,))
+
+    def remove_where(self, table, column):
+        """
+        State without the where statement on column of table.
+        """
+        key = (table, column)
+        if key not in self.where:
+            return self
+        return self.replace(where=_delete(self.where, key),
+                            where_parameters=_delete(self.where_parameters, key))
+
+    def set_join(self, table1, table2, how, universe):
+        """
+        State with the way two tables are joined set to how, whichever of the
+        two tables the join is stored on in universe.
+        """
+        joins = universe.tables[table1].get('Joins')
+        table_tuple = (table1, table2)
+        if not isinstance(joins, dict) or table2 not in joins:
+            table_tuple = (table2, table1)
+        return self.replace(how_to_join=_set(self.how_to_join, table_tuple, how))
+
+
+def _diff_mapping(kind, old, new):
+    """
+    Changes between two mappings, as (kind, key, value) with value None for
+    removed keys.
+    """
+    changes = [(kind, key, value) for key, value in new.items()
+               if key not in old or old[key] != value]
+    changes += [(kind, key, None) for key in old if key not in new]
+    return changes
+
+
+def diff(old, new):
+    """
+    Returns the changes from state old to state new, as a list of tuples:
+    ('tables', tables), ('columns', table, columns or None), ('where', key,
+    string or None), ('where_parameters', key, values or None), ('how_to_join',
+    table_tuple, how or None), and (attribute, value) for the other attributes.
+    Attributes that the states share are skipped without comparing them.
+    """
+    changes = []
+    for name in QueryState.__slots__:
+        old_value = getattr(old, name)
+        new_value = getattr(new, name)
+        if old_value is new_value:
+            continue
+        if isinstance(new_value, MappingProxyType):
+            changes += _diff_mapping(name, old_value, new_value)
+        elif old_value != new_value:
+            changes.append((name, new_value))
+    return changes
+
+
+def apply_diff(state, changes):
+    """
+    Returns state with the changes of diff applied.
+    """
+    replaced = {}
+    for change in changes:
+        name = change[0]
+        if len(change) == 2:
+            replaced[name] = change[1]
+            continue
+        mapping = replaced.get(name, getattr(state, name))
+        if change[2] is None:
+            replaced[name] = _delete(mapping, change[1]) if change[1] in mapping else mapping
+        else:
+            replaced[name] = _set(mapping, change[1], change[2])
+    return state.replace(**replaced)
+
+
+class History:
+    """
+    Undo and redo for query states. Since states are immutable and share
+    their parts, keeping every state costs little.
+    """
+
+    def __init__(self, state=None):
+        self.state = QueryState() if state is None else state
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def commit(self, state):
+        """
+        Makes state the current state. Clears what could be redone.
+        """
+        if state is not self.state:
+            self.undo_stack.append(self.state)
+            self.state = state
+            self.redo_stack = []
+        return state
+
+    def undo(self):
+        """
+        Goes back to the previous state and returns it, or None if there is
+        nothing to undo.
+        """
+        if not self.undo_stack:
+            return None
+        self.redo_stack.append(self.state)
+        self.state = self.undo_stack.pop()
+        return self.state
+
+    def redo(self):
+        """
+        Goes forward to the state that was undone and returns it, or None if
+        there is nothing to redo.
+        """
+        if not self.redo_stack:
+            return None
+        self.undo_stack.append(self.state)
+        self.state = self.redo_stack.pop()
+        return self.state
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation for Universe and Query. A Stats object collects the
+wall time per phase and counters such as the number of nodes expanded by path
+searches. Without a Stats object nothing is measured.
+"""
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Stats:
+    """
+    Collects the total wall time and number of calls per phase, and counters.
+    hook, if given, is called as hook(kind, name, value) for every measurement,
+    with kind 'time' (value in seconds) or 'count', so the numbers can be
+    forwarded to a metrics system.
+    """
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.timings = {}
+        self.calls = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add_time(self, phase, seconds):
+        """
+        Records seconds spent in phase.
+        """
+        with self.lock:
+            self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+            self.calls[phase] = self.calls.get(phase, 0) + 1
+        if self.hook is not None:
+            self.hook('time', phase, seconds)
+
+    def count(self, counter, amount=1):
+        """
+        Increases counter by amount.
+        """
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+        if self.hook is not None:
+            self.hook('count', counter, amount)
+
+    @contextmanager
+    def measure(self, phase):
+        """
+        Context manager that records the time spent in its body as phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def as_dict(self):
+        """
+        Copy of the collected numbers.
+        """
+        with self.lock:
+            return {'timings': dict(self.timings),
+                    'calls': dict(self.calls),
+                    'counters': dict(self.counters)}
+
+    def reset(self):
+        """
+        Forgets everything collected so far.
+        """
+        with self.lock:
+            self.timings.clear()
+            self.calls.clear()
+            self.counters.clear()
+
+
+def measure(stats, phase):
+    """
+    stats.measure(phase), or a context manager that does nothing if stats is
+    None.
+    """
+    if stats is None:
+        return nullcontext()
+    return stats.measure(phase)
+
+
+def increment(stats, counter, amount=1):
+    """
+    stats.count(counter, amount), unless stats is None.
+    """
+    if stats is not None:
+        stats.count(counter, amount)
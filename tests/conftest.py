@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures. The modules live at the top of the repository, next to
+example.JSON.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+EXAMPLE = os.path.join(ROOT, 'example.JSON')
+
+with open(os.path.join(ROOT, 'tests', 'data', 'baseline.json'), encoding='utf-8') as baseline_file:
+    BASELINE_CASES = json.load(baseline_file)
+
+
+@pytest.fixture
+def write_universe(tmp_path):
+    """
+    Writes a universe file from a dictionary of tables and returns its path.
+    """
+    def write(graph, presets=None, name='universe.uni'):
+        path = tmp_path / name
+        path.write_text(json.dumps({'presets': presets or {}, 'graph': graph}))
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def generated(write_universe):
+    """
+    The generated universe of data/baseline.json.
+    """
+    from classes import Universe
+    universe = BASELINE_CASES['generated']['universe']
+    return Universe(write_universe(universe['graph'], universe['presets']))
+
+
+def joined_tables(joins):
+    """
+    The tables in a list of joins.
+    """
+    return {table for join in joins for table in join}
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import analyzer
+from classes import Query, Universe
+
+
+def table(name, priority, joins=None, **properties):
+    properties.update({'tag': [name], 'DBHandle': [name], 'Priority': [priority],
+                       'Columns': ['id']})
+    if joins is not None:
+        properties['Joins'] = joins
+    return properties
+
+
+def test_table_without_joins_is_joined_through_the_other_table(write_universe):
+    graph = {'a': table('a', 1, {'b': ['on a.id = b.id', 'inner']}),
+             'b': table('b', 2)}
+    report = analyzer.analyze(graph, {})
+    assert report['errors'] == []
+    universe = Universe(write_universe(graph), validate=True)
+    query = Query(universe)
+    query.add_tables('b')
+    query.add_tables('a')
+    assert query.find_joins() == [('a', 'b')]
+
+
+def test_errors(write_universe):
+    graph = {'a': table('a', 1, {'b': ['on a.id = b.id', 'inner'], 'x': ['on', 'inner']}),
+             'b': table('b', 'first', ['c']),
+             'c': {'tag': ['d'], 'Priority': [3]}}
+    presets = {'p': {'table': ['x'], 'column': ['id'], 'where': []}}
+    errors = analyzer.analyze(graph, presets)['errors']
+    assert errors == ['table a: joins to unknown table x',
+                      'table b: Priority is not a number',
+                      'table b: Joins is a non-empty list instead of an object',
+                      'table c: DBHandle is missing or not a non-empty list',
+                      'table c: tag d differs from the table name, but find_joins '
+                      'looks tables up by tag',
+                      'preset p: where is missing or not a non-empty list',
+                      'preset p: refers to unknown table x']
+    with pytest.raises(ValueError):
+        Universe(write_universe(graph, presets), validate=True)
+
+
+def test_statistics():
+    graph = {'a': table('a', 1, {'b': ['on', 'inner']}),
+             'b': table('b', 2, {'c': ['on', 'left']}),
+             'c': table('c', 3, {}),
+             'd': table('d', 4, {})}
+    report = analyzer.analyze(graph, {})
+    statistics = report['statistics']
+    assert statistics['components'] == [3, 1]
+    assert statistics['unreachable_pairs'] == 3
+    assert statistics['diameter'] == 2
+    assert sorted(statistics['furthest_pair']) == ['a', 'c']
+    assert statistics['most_joined'][0] == 'b'
+    assert 'tables without joins: d' in report['warnings']
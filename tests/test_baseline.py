@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+The joins of the default planners match the output of the original recursive
+path search, recorded in data/baseline.json for every ordered selection of
+the tables of example.JSON and for random selections of a generated universe.
+"""
+import pytest
+
+from conftest import BASELINE_CASES, EXAMPLE
+from classes import Query, Universe
+
+
+@pytest.fixture
+def universes(write_universe):
+    generated = BASELINE_CASES['generated']['universe']
+    return {'example': EXAMPLE,
+            'generated': write_universe(generated['graph'], generated['presets'])}
+
+
+@pytest.mark.parametrize('name', ['example', 'generated'])
+@pytest.mark.parametrize('planner, precompute_paths',
+                         [('greedy', False), ('bfs', False), ('greedy', True)])
+def test_matches_baseline(universes, name, planner, precompute_paths):
+    universe = Universe(universes[name], precompute_paths=precompute_paths)
+    for case in BASELINE_CASES[name]['cases']:
+        query = Query(universe)
+        query.planner = planner
+        for table in case['tables']:
+            query.add_tables(table)
+        assert query.compile_query() == case['sql'], case['tables']
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import shutil
+
+import cache
+from conftest import EXAMPLE
+from classes import Universe
+
+
+def cached_example(tmp_path):
+    path = str(tmp_path / 'example.JSON')
+    shutil.copy(EXAMPLE, path)
+    Universe(path, use_cache=True)
+    return path
+
+
+def test_cache_is_used(tmp_path):
+    path = cached_example(tmp_path)
+    state = cache.read_cache(path)
+    assert state['version'] == cache.file_hash(path)
+
+
+def test_cache_of_a_renamed_class_is_a_miss(tmp_path):
+    path = cached_example(tmp_path)
+    with open(cache.cache_filename(path), 'rb') as file:
+        header = pickle.load(file)
+    stale = pickle.dumps(header) + pickle.dumps(object()).replace(
+        b'builtins', b'builtinz')
+    with open(cache.cache_filename(path), 'wb') as file:
+        file.write(stale)
+    assert cache.read_cache(path) is None
+    assert Universe(path, use_cache=True).tables
+
+
+def test_touched_source_keeps_the_cache(tmp_path):
+    path = cached_example(tmp_path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.read_cache(path) is not None
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+
+import cli
+from conftest import EXAMPLE
+
+
+def run(lines, *options):
+    stdout = io.StringIO()
+    status = cli.main([EXAMPLE] + list(options), io.StringIO(''.join(lines)), stdout)
+    return status, stdout.getvalue().splitlines()
+
+
+def test_one_line_of_sql_per_spec():
+    status, lines = run(['{"tables": ["table1", "table2"]}\n', '\n',
+                         '{"tables": ["table3"]}\n'])
+    assert status == 0
+    assert len(lines) == 2
+    assert lines[0] == ('select table1.*, table2.* from tables.table1 table1 inner join '
+                        'tables.table2 table2 on table2.a = table1.a where 1 = 1')
+    assert 'tables.table3' in lines[1]
+
+
+def test_failed_spec_gives_an_empty_line(capsys):
+    status, lines = run(['{"tables": ["nope"]}\n', '{"tables": ["table1"]}\n'])
+    assert status == 1
+    assert lines[0] == '' and lines[1]
+    assert 'KeyError' in capsys.readouterr().err
+
+
+def test_json_format():
+    status, lines = run(['{"tables": ["table1"], "id": "a"}\n'], '--format', 'json')
+    record = json.loads(lines[0])
+    assert status == 0
+    assert record['id'] == 'a' and 'sql' in record and 'seconds' in record
+
+
+def test_compact_sql():
+    assert cli.compact_sql('select *\n\nfrom t\n') == 'select * from t'
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from conftest import EXAMPLE
+from classes import CompileCache, Query, load_universe
+
+
+def example_query(compile_cache):
+    query = Query(load_universe(EXAMPLE), compile_cache=compile_cache)
+    query.add_tables('table1')
+    query.add_tables('table2')
+    return query
+
+
+def test_same_selection_is_a_hit():
+    compile_cache = CompileCache()
+    first = example_query(compile_cache).compile_query()
+    assert example_query(compile_cache).compile_query() == first
+    assert compile_cache.hits == 1
+
+
+def test_every_change_invalidates():
+    compile_cache = CompileCache()
+    query = example_query(compile_cache)
+    compiled = {query.compile_query()}
+    changes = [lambda: query.add_columns('table1', 'a'),
+               lambda: query.add_where('table1.b = 1', 'table1', 'b'),
+               lambda: query.set_join('table1', 'table2', 'left'),
+               lambda: query.add_tables('table3'),
+               lambda: query.remove_tables('table3'),
+               lambda: query.remove_columns('table1', 'a')]
+    for change in changes:
+        change()
+        compiled.add(query.compile_query())
+    assert len(compiled) == 6
+    assert 'table3' not in query.compile_query()
+
+
+def test_cache_is_bounded():
+    compile_cache = CompileCache(maxsize=2)
+    for table in ('table1', 'table2', 'table3'):
+        query = Query(load_universe(EXAMPLE), compile_cache=compile_cache)
+        query.add_tables(table)
+        query.compile_query()
+    assert len(compile_cache.entries) == 2
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from conftest import EXAMPLE
+from classes import build_query, compile_many, load_universe
+
+SPECS = [{'tables': ['table1', 'table2']},
+         {'tables': ['table3'], 'columns': {'table3': ['c']}},
+         {'tables': ['table1', 'table3'], 'planner': 'steiner', 'compact': True}]
+
+
+def test_compile_many_keeps_the_order_of_the_specs():
+    universe = load_universe(EXAMPLE)
+    expected = [build_query(universe, spec).compile_query() for spec in SPECS]
+    assert list(compile_many(EXAMPLE, SPECS)) == expected
+    assert list(compile_many(EXAMPLE, iter(SPECS * 3), processes=2)) == expected * 3
+
+
+def test_records_hold_errors_instead_of_raising():
+    records = list(compile_many(EXAMPLE, ['{"tables": ["table1"], "id": 7}',
+                                          '{"tables": ["nope"]}', 'not json'],
+                                records=True))
+    assert 'sql' in records[0] and records[0]['id'] == 7
+    assert records[1]['error'].startswith('KeyError')
+    assert records[2]['error'].startswith('JSONDecodeError')
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+from classes import build_query
+
+
+def table(name, rows, joins):
+    return {'tag': [name], 'DBHandle': [name], 'Priority': [len(name)], 'Rows': [rows],
+            'Columns': ['id', 'ref'], 'Joins': joins}
+
+
+def rows_of(sql, contents):
+    connection = sqlite3.connect(':memory:')
+    for name, values in contents.items():
+        connection.execute('create table {} (id, ref)'.format(name))
+        connection.executemany('insert into {} values (?, ?)'.format(name), values)
+    return sorted(connection.execute(sql).fetchall(), key=repr)
+
+
+def test_outer_join_is_not_reordered(write_universe):
+    path = write_universe({
+        'a': table('a', 1000, {'bb': ['on a.ref = bb.id', 'left']}),
+        'bb': table('bb', 100, {'ccc': ['on bb.ref = ccc.id', 'inner']}),
+        'ccc': table('ccc', 1, {})})
+    rows = {'a': [(1, 10), (2, 20)], 'bb': [(10, 5)], 'ccc': [(6, None)]}
+    results = []
+    for planner in ('greedy', 'cost'):
+        query = build_query(path, {'tables': ['a', 'ccc'], 'planner': planner,
+                                   'dialect': 'sqlite'})
+        results.append(rows_of(query.compile_query(), rows))
+    assert results[0] == results[1] == []
+
+
+def test_inner_joins_start_from_the_smallest_table(write_universe):
+    path = write_universe({
+        'a': table('a', 1000, {'bb': ['on a.ref = bb.id', 'inner']}),
+        'bb': table('bb', 100, {'ccc': ['on bb.ref = ccc.id', 'left']}),
+        'ccc': table('ccc', 1, {})})
+    rows = {'a': [(1, 10), (2, 20), (3, 30)], 'bb': [(10, 5), (20, 6)], 'ccc': [(5, None)]}
+    sql = {planner: build_query(path, {'tables': ['a', 'bb', 'ccc'], 'planner': planner,
+                                       'dialect': 'sqlite'}).compile_query()
+           for planner in ('greedy', 'cost')}
+    assert 'from bb bb' in sql['cost']
+    assert rows_of(sql['greedy'], rows) == rows_of(sql['cost'], rows)
+    assert len(rows_of(sql['cost'], rows)) == 2
+
+
+def test_left_join_stored_the_other_way_keeps_the_same_rows(write_universe):
+    path = write_universe({
+        'a': table('a', 1000, {}),
+        'bb': table('bb', 100, {'a': ['on a.ref = bb.id', 'left']})})
+    rows = {'a': [(1, 10), (2, 20)], 'bb': [(10, 5), (30, 6)]}
+    results = []
+    for planner in ('greedy', 'cost'):
+        query = build_query(path, {'tables': ['a', 'bb'], 'planner': planner,
+                                   'dialect': 'sqlite'})
+        results.append(rows_of(query.compile_query(), rows))
+    assert results[0] == results[1]
+    assert len(results[0]) == 2
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from emit import Emitter
+
+HANDLES = {'a': ('db.sales.orders', 'a'), 'b': ('db.sales.lines', 'b')}
+COLUMNS = [('a', ['id', 'order date']), ('b', ['*'])]
+JOINS = [('b', 'left', 'on a.id = b.order_id\n   and b.qty > 0')]
+
+
+def test_default_layout():
+    assert Emitter().emit(HANDLES, COLUMNS, 'a', JOINS, []) == (
+        'select\n\na.id,\na.[order date],\nb.*\n\nfrom db.sales.orders a\n\n'
+        'left join db.sales.lines b\non a.id = b.order_id\n   and b.qty > 0\n\n'
+        'where 1 = 1')
+
+
+def test_compact_layout_in_the_sqlite_dialect():
+    sql = Emitter('sqlite', compact=True).emit(HANDLES, COLUMNS, 'a', JOINS,
+                                               ['a.id > 1', 'b.qty < 5'])
+    assert sql == ('select a.id, a."order date", b.* from sales.orders a '
+                   'left join sales.lines b on a.id = b.order_id and b.qty > 0 '
+                   'where a.id > 1 and b.qty < 5')
+
+
+def test_quoting_per_dialect():
+    assert Emitter('postgres').column('say "hi"') == '"say ""hi"""'
+    assert Emitter('sqlserver').column('a]b') == '[a]]b]'
+    assert Emitter('postgres').handle('db.sales.orders') == 'db.sales.orders'
+
+
+def test_placeholders_per_dialect():
+    assert Emitter('postgres').placeholders('a.x = ? and a.y = ?') == 'a.x = %s and a.y = %s'
+    assert Emitter('sqlite').placeholders('a.x = ?') == 'a.x = ?'
+
+
+def test_unknown_dialect():
+    with pytest.raises(ValueError):
+        Emitter('oracle')
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from conftest import EXAMPLE
+from classes import build_query, load_universe
+from db import count_rows, count_statement
+from estimate import Estimator
+from standin import create_sqlite
+
+
+def test_estimate_uses_the_row_counts_of_the_estimator():
+    universe = load_universe(EXAMPLE)
+    estimator = Estimator(universe, {'table1': 1e6, 'table2': 10, 'table3': 500})
+    query = build_query(universe, {'tables': ['table1', 'table2', 'table3']})
+    estimate = estimator.estimate(query)
+    assert estimate['rows'] == 1e6
+    assert estimator.estimate(query) is estimate
+
+
+def test_count_rows_skips_tables_it_can_not_count():
+    universe = load_universe(EXAMPLE)
+    connection = create_sqlite(universe)
+    connection.executemany('insert into tables.table1 (a) values (?)', [(1,), (2,), (3,)])
+    connection.execute('drop table tables.table2')
+    row_counts = count_rows(connection, universe, dialect='sqlite', limit=2)
+    assert row_counts == {'table1': 2, 'table3': 0}
+
+
+def test_sampled_count_statement():
+    assert count_statement('db.dbo.orders', 'sqlserver', percent=1) == \
+        'select count(*) from db.dbo.orders tablesample (1 percent)'
+
+
+def test_fingerprint_tells_estimators_apart():
+    universe = load_universe(EXAMPLE)
+    query = build_query(universe, {'tables': ['table1', 'table2'], 'planner': 'estimated'})
+    query.estimator = Estimator(universe)
+    first = query.fingerprint()
+    query.estimator.close()
+    query.estimator = Estimator(universe)
+    assert query.fingerprint() != first
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from classes import Query
+from federation import FederatedUniverse, retag
+
+SALES = {'customer': {'tag': ['customer'], 'DBHandle': ['sales.dbo.customer'],
+                      'Priority': [1], 'Columns': ['id', 'name'],
+                      'Joins': {'orders': ['on customer.id = orders.customer_id', 'inner']}},
+         'orders': {'tag': ['orders'], 'DBHandle': ['sales.dbo.orders'], 'Priority': [2],
+                    'Columns': ['id', 'customer_id'], 'Joins': {}}}
+SUPPORT = {'customer': {'tag': ['customer'], 'DBHandle': ['support.dbo.customer'],
+                        'Priority': [1], 'Columns': ['id'],
+                        'Joins': {'ticket': ['on customer.id = ticket.customer_id', 'left']}},
+           'ticket': {'tag': ['ticket'], 'DBHandle': ['support.dbo.ticket'], 'Priority': [3],
+                      'Columns': ['id', 'customer_id'], 'Joins': {}}}
+
+
+def federation(write_universe, tmp_path, links):
+    write_universe(SALES, {'big': {'table': ['orders'], 'column': ['id'],
+                                   'where': ['orders.id > 100']}}, name='sales.uni')
+    write_universe(SUPPORT, name='support.uni')
+    path = tmp_path / 'both.fed'
+    path.write_text(json.dumps({'members': {'sales': 'sales.uni', 'support': 'support.uni'},
+                                'links': links}))
+    return FederatedUniverse(str(path))
+
+
+LINKS = [{'tables': ['sales__customer', 'support__customer'],
+          'on': 'on sales__customer.id = support__customer.id'}]
+
+
+def test_query_across_members(write_universe, tmp_path):
+    universe = federation(write_universe, tmp_path, LINKS)
+    assert sorted(universe.tables) == ['sales__customer', 'sales__orders',
+                                       'support__customer', 'support__ticket']
+    query = Query(universe)
+    query.add_tables('sales__orders')
+    query.add_tables('support__ticket')
+    assert query.find_joins() == [('sales__orders', 'sales__customer'),
+                                  ('sales__customer', 'support__customer'),
+                                  ('support__customer', 'support__ticket')]
+    sql = query.compile_query()
+    assert 'left join support.dbo.ticket support__ticket' in sql
+    assert 'on support__customer.id = support__ticket.customer_id' in sql
+    assert universe.tables['sales__orders']['Columns'] == ['id', 'customer_id']
+
+
+def test_presets_are_renamed(write_universe, tmp_path):
+    universe = federation(write_universe, tmp_path, LINKS)
+    assert universe.presets['sales__big'] == {'table': ['sales__orders'], 'column': ['id'],
+                                              'where': ['sales__orders.id > 100']}
+
+
+def test_unlinked_members_can_not_be_joined(write_universe, tmp_path):
+    query = Query(federation(write_universe, tmp_path, []))
+    query.add_tables('sales__orders')
+    query.add_tables('support__ticket')
+    with pytest.raises(ValueError):
+        query.find_joins()
+
+
+def test_link_to_an_unknown_table(write_universe, tmp_path):
+    with pytest.raises(ValueError):
+        federation(write_universe, tmp_path,
+                   [{'tables': ['sales__customer', 'support__nope'], 'on': 'on 1 = 1'}])
+
+
+def test_retag_only_rewrites_qualifying_tags():
+    assert retag('on customer.id = x.customer.id and customers.id = 1',
+                 {'customer': 'sales__customer'}) == (
+                     'on sales__customer.id = x.customer.id and customers.id = 1')
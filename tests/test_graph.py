@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import pickle
+
+from graph import NO_PATH, CompactGraph
+
+# a - b - c - d, a - e - d, f on its own
+CONNECTIONS = {'a': ['b', 'e'], 'b': ['a', 'c'], 'c': ['b', 'd'], 'd': ['c', 'e'],
+               'e': ['a', 'd'], 'f': []}
+
+
+def names(graph, path):
+    return None if path is None else [graph.names[node] for node in path]
+
+
+def test_adjacency_keeps_the_order_of_the_connections():
+    graph = CompactGraph(CONNECTIONS)
+    assert len(graph) == 6
+    for name, connected in CONNECTIONS.items():
+        assert names(graph, graph.neighbours(graph.ids[name])) == connected
+    copy = pickle.loads(pickle.dumps(graph))
+    assert list(copy.targets) == list(graph.targets)
+
+
+def test_nearest_path():
+    graph = CompactGraph(CONNECTIONS)
+    ids = graph.ids
+    path, _ = graph.nearest_path([ids['a']], {ids['d']})
+    assert names(graph, path) == ['a', 'e', 'd']
+    path, _ = graph.nearest_path([ids['a']], {ids['d']}, excluded={ids['e']})
+    assert names(graph, path) == ['a', 'b', 'c', 'd']
+    path, _ = graph.nearest_path([ids['b'], ids['c']], {ids['c']})
+    assert names(graph, path) == ['c']
+    assert graph.nearest_path([ids['a']], {ids['f']})[0] is None
+
+
+def test_cheapest_path_follows_the_weights():
+    graph = CompactGraph(CONNECTIONS)
+    ids = graph.ids
+    expensive = {ids['e']}
+
+    def weight(node1, node2):
+        return 10 if node1 in expensive or node2 in expensive else 1
+
+    path, _ = graph.cheapest_path([ids['a']], {ids['d']}, weight)
+    assert names(graph, path) == ['a', 'b', 'c', 'd']
+    assert graph.cheapest_path([ids['a']], {ids['f']}, weight)[0] is None
+
+
+def test_next_hop_table_gives_the_shortest_paths():
+    graph = CompactGraph(CONNECTIONS)
+    ids = graph.ids
+    next_hop = graph.next_hop_table()
+    assert names(graph, graph.indexed_path(next_hop, ids['b'], ids['e'])) == ['b', 'a', 'e']
+    assert graph.indexed_path(next_hop, ids['c'], ids['c']) == [ids['c']]
+    assert graph.indexed_path(next_hop, ids['a'], ids['f']) is None
+    assert next_hop[ids['f']][ids['a']] == NO_PATH
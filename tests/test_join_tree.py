@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import random
+
+from classes import Query
+from conftest import joined_tables
+from stats import Stats
+
+
+def check_tree(query, selected):
+    joins = query.find_joins()
+    tables = joined_tables(joins)
+    if len(selected) > 1:
+        assert set(selected) <= tables
+        assert len(joins) == len(tables) - 1
+    assert set(query.implicit_tables) == tables - set(selected)
+    degrees = {}
+    for join in joins:
+        for table in join:
+            degrees[table] = degrees.get(table, 0) + 1
+    assert all(degrees[table] > 1 for table in query.implicit_tables)
+
+
+def test_incremental_tree_follows_toggled_tables(generated):
+    rnd = random.Random(7)
+    names = sorted(generated.tables)
+    query = Query(generated)
+    query.planner = 'incremental'
+    selected = []
+    for _ in range(80):
+        table = rnd.choice(names)
+        if table in selected and len(selected) > 1:
+            selected.remove(table)
+            query.remove_tables(table)
+        elif table not in selected:
+            selected.append(table)
+            query.add_tables(table)
+        check_tree(query, selected)
+
+
+def test_toggled_tables_are_planned_on_the_snapshot(generated):
+    names = sorted(generated.tables)
+    stats = Stats()
+    query = Query(generated, stats=stats)
+    query.planner = 'incremental'
+    for table in names[:3]:
+        query.add_tables(table)
+    query.find_joins()
+    expanded = dict(stats.counters)
+    query.add_tables(names[3])
+    query.remove_tables(names[0])
+    assert stats.counters == expanded
+    snapshot = query.snapshot()
+    check_tree(snapshot, names[1:4])
+    assert query.join_tree.terminals == names[:3]
+    query.restore(snapshot)
+    assert query.join_tree.terminals == names[1:4]
+    check_tree(query, names[1:4])
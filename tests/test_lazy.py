@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+
+import lazy
+from classes import Universe
+
+
+def wide_tables(columns):
+    return {
+        'a': {'tag': ['a'], 'DBHandle': ['a'], 'Priority': [1], 'Columns': ['id'],
+              'Joins': {'b': ['on a.id = b.id', 'inner']}},
+        'b': {'tag': ['b'], 'DBHandle': ['b'], 'Priority': [2], 'Columns': columns,
+              'Joins': {}}}
+
+
+def test_columns_are_loaded_on_first_access(write_universe):
+    path = write_universe(wide_tables(['id', 'x']))
+    Universe(path, lazy_columns=True)
+    universe = Universe(path, lazy_columns=True)
+    assert not universe.tables['b'].is_loaded()
+    assert universe.tables['b']['Joins'] == {}
+    assert not universe.tables['b'].is_loaded()
+    assert universe.tables['b']['Columns'] == ['id', 'x']
+    assert universe.tables['b'].is_loaded()
+
+
+def test_lazy_tables_survive_pickling(write_universe):
+    path = write_universe(wide_tables(['id', 'x']))
+    Universe(path, lazy_columns=True)
+    table = Universe(path, lazy_columns=True).tables['b']
+    assert dict(pickle.loads(pickle.dumps(table)))['Columns'] == ['id', 'x']
+
+
+def test_older_universe_keeps_its_columns_after_a_change(write_universe):
+    path = write_universe(wide_tables(['id', 'x']))
+    Universe(path, lazy_columns=True)
+    old = Universe(path, lazy_columns=True)
+    stat = os.stat(path)
+    write_universe(wide_tables(['id', 'y', 'z', 'a much longer column name']))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    new = Universe(path, lazy_columns=True)
+    assert new.tables['b']['Columns'] == ['id', 'y', 'z', 'a much longer column name']
+    assert old.tables['b']['Columns'] == ['id', 'x']
+    assert old.tables['a']['Columns'] == ['id']
+
+
+def test_unreadable_sidecar_is_rebuilt(write_universe):
+    path = write_universe(wide_tables(['id', 'x']))
+    Universe(path, lazy_columns=True)
+    with open(lazy.sidecar_filename(path), 'wb') as file:
+        pickle.dump({'format': lazy.SIDECAR_FORMAT, 'presets': {}}, file)
+    assert lazy.read_sidecar(path) is None
+    with open(lazy.sidecar_filename(path), 'wb') as file:
+        file.write(pickle.dumps(object()).replace(b'builtins', b'builtinz'))
+    assert lazy.read_sidecar(path) is None
+    assert Universe(path, lazy_columns=True).tables['b']['Columns'] == ['id', 'x']
+    assert lazy.read_sidecar(path) is not None
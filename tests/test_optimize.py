@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from classes import build_query
+
+
+def universe(write_universe, foreign_keys):
+    def table(name, joins):
+        entry = {'tag': [name], 'DBHandle': ['s.' + name], 'Priority': [1],
+                 'Columns': ['id', 'name', 'customer_id', 'region_id'], 'Joins': joins}
+        if foreign_keys:
+            entry['ForeignKey'] = {other: [True] for other in joins}
+        return entry
+    return write_universe({
+        'orders': table('orders', {'customer': ['on orders.customer_id = customer.id', 'inner']}),
+        'customer': table('customer', {'region': ['on customer.region_id = region.id', 'inner']}),
+        'region': table('region', {})})
+
+
+@pytest.fixture
+def orders(write_universe):
+    return universe(write_universe, foreign_keys=True)
+
+
+def test_unused_foreign_key_chain_is_eliminated(orders):
+    query = build_query(orders, {'columns': {'orders': ['id']},
+                                 'tables': ['region'], 'prune_joins': True})
+    assert build_query(orders, {'tables': ['orders']}).compile_query().replace(
+        'orders.*', 'orders.id') == query.compile_query()
+
+
+def test_join_used_by_a_where_statement_is_kept(orders):
+    query = build_query(orders, {'columns': {'orders': ['id']}, 'tables': ['region'],
+                                 'where': [{'table': 'region', 'column': 'name',
+                                            'where': "region.name = 'north'"}],
+                                 'prune_joins': True})
+    assert 'join s.region region' in query.compile_query()
+
+
+def test_without_foreign_key_the_join_is_kept(write_universe):
+    path = universe(write_universe, foreign_keys=False)
+    query = build_query(path, {'columns': {'orders': ['id']},
+                               'tables': ['region'], 'prune_joins': True})
+    assert 'join s.region region' in query.compile_query()
+
+
+def test_expand_star(orders):
+    query = build_query(orders, {'tables': ['region'], 'expand_star': True})
+    assert 'region.id,' in query.compile_query()
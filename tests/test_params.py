@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from classes import build_query, load_universe
+from conftest import EXAMPLE
+from params import bind_parameters, render_placeholders
+
+
+def test_placeholders_are_bound_in_order():
+    assert bind_parameters('a.x = ? and a.y in (?, ?)', [1, 'b', 2.5]) == (
+        'a.x = ? and a.y in (?, ?)', [1, 'b', 2.5])
+    with pytest.raises(ValueError):
+        bind_parameters('a.x = ?')
+    with pytest.raises(ValueError):
+        bind_parameters('a.x = ?', [1, 2])
+
+
+def test_literals_become_parameters():
+    template, values = bind_parameters(
+        "a.x = 'it''s' and a.y > 3 and a.z = ? and a.w = 1.5 and N'n' = a.v", [7],
+        literals=True)
+    assert template == 'a.x = ? and a.y > ? and a.z = ? and a.w = ? and ? = a.v'
+    assert values == ["it's", 3, 7, 1.5, 'n']
+
+
+def test_identifiers_and_quoted_text_are_left_alone():
+    where = 'table1.col2 = "?" and [a 1] = t1.c3 and \'?\' = x'
+    template, values = bind_parameters(where, literals=False)
+    assert (template, values) == (where, [])
+    assert bind_parameters('t2.c1 = 1', literals=True) == ('t2.c1 = ?', [1])
+
+
+def test_render_placeholders():
+    assert render_placeholders("a.x like '5%' and a.y = ?", 'format') == (
+        "a.x like '5%%' and a.y = %s")
+    assert render_placeholders("a.x = '?' and a.y = ?", 'format') == "a.x = '?' and a.y = %s"
+    assert render_placeholders('a.y = ?', 'qmark') == 'a.y = ?'
+
+
+def test_variants_of_a_report_share_their_statement():
+    universe = load_universe(EXAMPLE)
+    compiled = []
+    for value in (1, 2):
+        query = build_query(universe, {
+            'tables': ['table1'], 'parameterize': True, 'dialect': 'postgres',
+            'where': [{'table': 'table1', 'column': 'a',
+                       'where': "table1.a = {} and table1.b = 'x'".format(value)}]})
+        compiled.append(query.compile_parameterized())
+    assert compiled[0][0] == compiled[1][0]
+    assert 'table1.a = %s and table1.b = %s' in compiled[0][0]
+    assert [compiled[0][1], compiled[1][1]] == [[1, 'x'], [2, 'x']]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import pickle
+import shutil
+
+import pathindex
+from conftest import EXAMPLE
+from classes import Universe
+
+
+def indexed_example(tmp_path):
+    path = str(tmp_path / 'example.JSON')
+    shutil.copy(EXAMPLE, path)
+    pathindex.write_index(Universe(path))
+    return path
+
+
+def test_index_is_used(tmp_path):
+    path = indexed_example(tmp_path)
+    universe = Universe(path)
+    assert pathindex.read_index(universe) == universe.build_path_index()
+
+
+def test_index_of_another_version_is_a_miss(tmp_path):
+    path = indexed_example(tmp_path)
+    universe = Universe(path)
+    universe.version = 'other'
+    assert pathindex.read_index(universe) is None
+
+
+def test_unreadable_index_is_a_miss(tmp_path):
+    path = indexed_example(tmp_path)
+    universe = Universe(path)
+    with open(pathindex.index_filename(path), 'wb') as file:
+        pickle.dump({'format': pathindex.INDEX_FORMAT, 'names': universe.graph.names}, file)
+    assert pathindex.read_index(universe) is None
+    with open(pathindex.index_filename(path), 'wb') as file:
+        file.write(pickle.dumps(object()).replace(b'builtins', b'builtinz'))
+    assert pathindex.read_index(universe) is None
+    assert Universe(path, precompute_paths=True).next_hop == universe.build_path_index()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from classes import JOIN_PLANNERS, Query, Universe
+from conftest import BASELINE_CASES, joined_tables
+
+
+@pytest.mark.parametrize('planner', JOIN_PLANNERS)
+def test_planners_join_every_selected_table(generated, planner):
+    for case in BASELINE_CASES['generated']['cases']:
+        query = Query(generated)
+        query.planner = planner
+        for table in case['tables']:
+            query.add_tables(table)
+        joins = query.find_joins()
+        assert set(case['tables']) <= joined_tables(joins)
+        assert len(joins) == len(joined_tables(joins)) - 1
+        assert set(query.implicit_tables) == joined_tables(joins) - set(case['tables'])
+
+
+def test_unknown_planner(generated):
+    with pytest.raises(ValueError):
+        generated.join_paths(['t0', 't1'], 'unknown')
+
+
+def isolated_tables(write_universe):
+    return Universe(write_universe({
+        'a': {'tag': ['a'], 'DBHandle': ['a'], 'Priority': [1],
+              'Joins': {'c': ['on a.id = c.id', 'inner']}},
+        'b': {'tag': ['b'], 'DBHandle': ['b'], 'Priority': [2], 'Joins': {}},
+        'c': {'tag': ['c'], 'DBHandle': ['c'], 'Priority': [3], 'Joins': {}}}))
+
+
+@pytest.mark.parametrize('planner', JOIN_PLANNERS + ('incremental',))
+@pytest.mark.parametrize('tables', [['a', 'b'], ['a', 'b', 'c']])
+def test_tables_that_can_not_be_joined(write_universe, planner, tables):
+    query = Query(isolated_tables(write_universe))
+    query.planner = planner
+    for table in tables:
+        query.add_tables(table)
+    with pytest.raises(ValueError):
+        query.find_joins()
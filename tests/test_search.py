@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from search import NameIndex
+
+NAMES = ['OrderId', 'order_date', 'customer', 'id', 'x', 'ShipDate', 'ORDERED_BY']
+
+
+def test_search_ignores_case():
+    index = NameIndex(NAMES)
+    assert index.search('order') == ['ORDERED_BY', 'OrderId', 'order_date']
+    assert index.search('DATE') == ['ShipDate', 'order_date']
+    assert index.search('orders') == []
+
+
+def test_short_search_texts_check_every_name():
+    index = NameIndex(NAMES)
+    assert index.search('') == index.names
+    assert index.search('X') == ['x']
+    assert index.search('id') == ['OrderId', 'id']
+
+
+def test_short_names_are_found():
+    index = NameIndex(NAMES)
+    assert index.search('i') == ['OrderId', 'ShipDate', 'id']
+    assert index.search('xyz') == []
+
+
+def test_search_stops_at_the_limit():
+    index = NameIndex(NAMES)
+    assert index.search('order', limit=2) == ['ORDERED_BY', 'OrderId']
+    assert len(index) == len(NAMES)
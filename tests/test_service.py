@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import EXAMPLE
+from classes import load_universe
+from service import ConnectionPool, QueryService
+from standin import create_sqlite
+
+
+def test_failed_connect_frees_its_slot():
+    universe = load_universe(EXAMPLE)
+    attempts = []
+
+    def connect():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise OSError('refused')
+        return create_sqlite(universe)
+
+    async def validate_twice():
+        pool = ConnectionPool(connect, size=1)
+        with ThreadPoolExecutor(2) as executor:
+            return await asyncio.wait_for(asyncio.gather(
+                pool.validate('select * from tables.table1', executor),
+                pool.validate('select * from tables.table1', executor)), 5)
+
+    failed, validated = asyncio.run(validate_twice())
+    assert failed == {'valid': False, 'validation_error': 'OSError: refused'}
+    assert validated['valid']
+
+
+def test_stats_request():
+    service = QueryService(EXAMPLE)
+
+    async def requests():
+        record = await service.handle_spec('{"tables": ["table1"]}')
+        stats = await service.handle_spec('{"stats": true}')
+        return record, stats
+
+    record, stats = asyncio.run(requests())
+    assert 'sql' in record
+    assert stats['requests'] == 1
+    assert set(stats['latency']) == {'p50', 'p90', 'p99'}
+
+
+def test_validation_in_the_dialect_of_the_pool():
+    service = QueryService(EXAMPLE)
+    service.pool = ConnectionPool(lambda: create_sqlite(service.universe), size=1)
+    spec = {'tables': ['table1'], 'dialect': 'postgres',
+            'where': [{'table': 'table1', 'column': 'a', 'where': 'table1.a = ?',
+                       'parameters': [1]}]}
+    record = asyncio.run(service.handle_spec(spec))
+    assert '%s' in record['sql']
+    assert record['valid'], record
+
+
+def test_reading_pauses_while_requests_are_pending():
+    service = QueryService(EXAMPLE, max_pending=2)
+    started = []
+    release = asyncio.Event()
+
+    async def handle_spec(spec):
+        started.append(spec)
+        await release.wait()
+        return {'spec': spec.strip()}
+
+    service.handle_spec = handle_spec
+
+    async def send():
+        server = await service.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(''.join('{}\n'.format(number) for number in range(20)).encode())
+            writer.write_eof()
+            await asyncio.sleep(0.2)
+            in_flight = len(started)
+            release.set()
+            answers = [json.loads(line) for line in (await reader.read()).splitlines()]
+            writer.close()
+        return in_flight, answers
+
+    in_flight, answers = asyncio.run(send())
+    assert in_flight <= 4
+    assert answers == [{'spec': str(number)} for number in range(20)]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from classes import Query, Universe, compile_state
+from state import History, QueryState, apply_diff, diff
+
+GRAPH = {
+    'a': {'tag': ['a'], 'DBHandle': ['a'], 'Priority': [1], 'Columns': ['id', 'x'],
+          'Joins': {'b': ['on a.id = b.id', 'inner']}},
+    'b': {'tag': ['b'], 'DBHandle': ['b'], 'Priority': [2], 'Columns': ['id', 'y'],
+          'Joins': {}}}
+PRESETS = {'recent b': {'table': ['b'], 'column': ['y'], 'where': ['b.y > 2']}}
+
+
+@pytest.fixture
+def universe(write_universe):
+    return Universe(write_universe(GRAPH, PRESETS))
+
+
+def test_state_methods_match_query(universe):
+    query = Query(universe)
+    query.add_tables('a')
+    query.add_columns('a', 'x')
+    query.add_preset('recent b')
+    query.set_join('b', 'a', 'left')
+    state = (QueryState().add_tables('a').add_columns('a', 'x')
+             .add_preset('recent b', universe).set_join('b', 'a', 'left', universe))
+    assert state == query.freeze()
+    assert state.how_to_join == {('a', 'b'): 'left'}
+    assert compile_state(universe, state) == query.compile_query()
+
+
+def test_where_with_the_wrong_number_of_parameters_fails_early():
+    with pytest.raises(ValueError):
+        QueryState().add_where('a.x = ? and a.id = ?', 'a', 'x', [1])
+
+
+def test_diff_replays_the_changes(universe):
+    base = QueryState().add_tables('a').add_where('a.x = ?', 'a', 'x', [1])
+    changed = (base.add_tables('b').add_columns('b', 'y').remove_where('a', 'x')
+               .set_join('a', 'b', 'left', universe).replace(dialect='postgres'))
+    changes = diff(base, changed)
+    assert ('tables', ('a', 'b')) in changes
+    assert ('where', ('a', 'x'), None) in changes
+    assert ('dialect', 'postgres') in changes
+    assert apply_diff(base, changes) == changed
+    assert diff(changed, changed) == []
+
+
+def test_history_undo_and_redo():
+    history = History()
+    first = history.commit(history.state.add_tables('a'))
+    second = history.commit(first.add_tables('b'))
+    assert history.undo() is first
+    assert history.undo() == QueryState()
+    assert history.undo() is None
+    assert history.redo() is first
+    history.commit(first.add_columns('a', 'x'))
+    assert history.redo() is None
+    assert history.undo() is first
+    assert second not in history.undo_stack
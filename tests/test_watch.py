@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+
+from classes import Universe
+from stats import Stats
+from watch import UniverseWatcher
+
+
+def table(name, priority, joins):
+    return {'tag': [name], 'DBHandle': [name], 'Priority': [priority], 'Columns': ['id'],
+            'Joins': joins}
+
+
+GRAPH = {'a': table('a', 1, {'b': ['on a.id = b.id', 'inner']}), 'b': table('b', 2, {})}
+
+
+def rewrite(write_universe, path, graph):
+    stat = os.stat(path)
+    write_universe(graph)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_changed_file_is_swapped_in(write_universe):
+    path = write_universe(GRAPH)
+    reloaded = []
+    stats = Stats()
+    watcher = UniverseWatcher(path, on_reload=lambda universe, report: reloaded.append(
+        (universe, report)), stats=stats)
+    old = watcher.universe
+    assert watcher.check() is None
+    changed = dict(GRAPH, b=table('b', 2, {'c': ['on b.id = c.id', 'left']}),
+                   c=table('c', 3, {}))
+    rewrite(write_universe, path, changed)
+    report = watcher.check()
+    assert report['tables_added'] == ['c']
+    assert report['tables_changed'] == ['b']
+    assert report['tables_removed'] == []
+    assert reloaded == [(watcher.universe, report)]
+    assert watcher.universe is not old and sorted(old.tables) == ['a', 'b']
+    assert stats.counters['reloads'] == 1
+    assert watcher.check() is None
+
+
+def test_touched_file_is_not_reloaded(write_universe):
+    path = write_universe(GRAPH)
+    watcher = UniverseWatcher(Universe(path))
+    universe = watcher.universe
+    rewrite(write_universe, path, GRAPH)
+    assert watcher.check() is None
+    assert watcher.universe is universe
+
+
+def test_invalid_file_is_not_swapped_in(write_universe):
+    path = write_universe(GRAPH)
+    watcher = UniverseWatcher(path, validate=True)
+    universe = watcher.universe
+    rewrite(write_universe, path, dict(GRAPH, b=table('b', 2, {'x': ['on', 'inner']})))
+    assert 'error' in watcher.check()
+    assert watcher.check() is None
+    assert watcher.universe is universe
+    rewrite(write_universe, path, dict(GRAPH, c=table('c', 3, {})))
+    assert watcher.check()['tables_added'] == ['c']
+
+
+def test_start_and_stop(write_universe):
+    watcher = UniverseWatcher(write_universe(GRAPH), interval=0.01).start()
+    assert watcher.thread.is_alive()
+    watcher.stop()
+    assert watcher.thread is None
@@ -6,10 +6,15 @@ Created on Thu Aug 10 10:46:28 2017
 """
 
 import sys
+from PyQt5.QtCore import (Qt, QAbstractListModel, QModelIndex, QObject, QRunnable,
+                          QThreadPool, pyqtSignal)
 from PyQt5.QtWidgets import (QMainWindow, QDesktopWidget, QFileDialog, QDialog,
                              QRadioButton, QPushButton, QCheckBox, QTextEdit,
-                             QButtonGroup, QLineEdit, QApplication)
-from classes import Query
+                             QButtonGroup, QLineEdit, QApplication, QListView,
+                             QVBoxLayout, QProgressDialog)
+from classes import Query, Universe
+from stats import Stats
+from watch import UniverseWatcher
 
 
 #Global constants defining the amount of vertical space between those specific items.
@@ -17,25 +22,245 @@ PUSHBUTTONHEIGHT = 40
 RADIOBUTTONHEIGHT = 20
 CHECKBOXHEIGHT = 20
 
-class CreateQueryInterface(QMainWindow, Query):
+
+class WorkerSignals(QObject):
     """
-    This class provides a GUI to the Query class imported from classes.py.
-    Upon initialization creates a filedialog to select a JSON file to serve as
-    context (Universe). These files have their extension changed to .uni to make
-    filtering easier. The generated files will be in one specific directory, so
-    this location is hardcoded.
+    Signals of a Worker. They are delivered on the GUI thread, with the
+    generation the worker was started in.
+    """
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    progress = pyqtSignal(str)
+
+
+class Worker(QRunnable):
+    """
+    Runs function(*args) on a thread of a QThreadPool and emits its result
+    through signals. With progress, the function also gets a progress keyword
+    argument to report messages with.
     """
 
-    def __init__(self):
+    def __init__(self, generation, function, *args, progress=False):
+        super().__init__()
+        self.generation = generation
+        self.function = function
+        self.args = args
+        self.signals = WorkerSignals()
+        self.keywords = {'progress': self.signals.progress.emit} if progress else {}
+
+    def run(self):
+        """
+        Runs the function and emits finished or failed.
+        """
         try:
-            super().__init__(filename=QFileDialog.getOpenFileName(
-                    None,
-                    'Select universe',
-                    'R:/NL/Database Marketing/R library/SQL builder/Universes',
-                    'Universes (*.uni)')[0])
-        except FileNotFoundError:
-            sys.exit()
+            result = self.function(*self.args, **self.keywords)
+        except (LookupError, OSError, TypeError, ValueError) as error:
+            self.signals.failed.emit(self.generation,
+                                     '{}: {}'.format(type(error).__name__, error))
+        else:
+            self.signals.finished.emit(self.generation, result)
+
+
+def open_universe(filename, progress):
+    """
+    Loads a universe, reporting each phase of loading through progress.
+    """
+    def report(kind, phase, _):
+        if kind == 'time':
+            progress('Loading universe: ' + phase + ' done')
+    universe = Universe(filename, stats=Stats(report))
+    universe.stats = None
+    return universe
+
+
+def plan_joins(query):
+    """
+    Finds the joins of a query snapshot. Returns the snapshot and the joins.
+    """
+    return query, query.find_joins()
+
+
+def compile_snapshot(query):
+    """
+    Compiles a query snapshot. Returns the snapshot and the query.
+    """
+    return query, query.compile_query()
+
+
+class UniverseLoader(QProgressDialog):
+    """
+    Progress dialog shown while the universe is loaded on a worker thread.
+    When it is loaded, the main window is created.
+    """
+
+    def __init__(self, filename):
+        super().__init__('Loading universe...', 'Close', 0, 0)
+        self.setWindowTitle('SQL Builder')
+        self.interface = None
+        self.worker = Worker(0, open_universe, filename, progress=True)
+        self.worker.signals.progress.connect(self.setLabelText)
+        self.worker.signals.finished.connect(self.loaded)
+        self.worker.signals.failed.connect(self.failed)
+        QThreadPool.globalInstance().start(self.worker)
+        self.show()
+
+    def loaded(self, _, universe):
+        """
+        Opens the main window on the loaded universe.
+        """
+        self.interface = CreateQueryInterface(universe)
+        self.close()
+
+    def failed(self, _, message):
+        """
+        Shows why the universe couldn't be loaded.
+        """
+        self.setRange(0, 1)
+        self.setLabelText(message)
+
+
+class ColumnModel(QAbstractListModel):
+    """
+    List model of the columns of a table that match the search text, checked
+    when they are active in the query. The view only draws the visible rows,
+    so opening and filtering don't depend on the width of the table. The
+    matching is done by the search index of the universe.
+    """
+
+    def __init__(self, query, table):
+        super().__init__()
+        self.query = query
+        self.table = table
+        self.name_index = query.universe.column_index(table)
+        self.columns = self.name_index.names
+
+    def rowCount(self, parent=QModelIndex()):
+        """
+        Number of matching columns.
+        """
+        if parent.isValid():
+            return 0
+        return len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        """
+        Name and checked state of a column.
+        """
+        column = self.columns[index.row()]
+        if role == Qt.DisplayRole:
+            return column
+        if role == Qt.CheckStateRole:
+            if column in self.query.active_columns[self.table]:
+                return Qt.Checked
+            return Qt.Unchecked
+        return None
+
+    def flags(self, index):
+        """
+        Columns can be checked, not edited.
+        """
+        return Qt.ItemIsEnabled | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        """
+        Adds or removes the column from the query when it is (un)checked.
+        """
+        if role != Qt.CheckStateRole:
+            return False
+        column = self.columns[index.row()]
+        if value == Qt.Checked:
+            self.query.add_columns(self.table, column)
+        elif column in self.query.active_columns[self.table]:
+            self.query.remove_columns(self.table, column)
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def set_filter(self, text):
+        """
+        Shows only the columns whose name contains text.
+        """
+        self.beginResetModel()
+        self.columns = self.name_index.search(text)
+        self.endResetModel()
+
+class CreateQueryInterface(QMainWindow, Query):
+    """
+    This class provides a GUI to the Query class imported from classes.py.
+    It is created by UniverseLoader once the selected universe is loaded.
+    Joins are maintained incrementally while tables are toggled, so clicking a
+    table doesn't replan all joins. The toggled tables are only recorded here;
+    updating the join tree, planning and compiling run on a worker thread, on
+    a snapshot of the query; every change of the selection starts a new
+    generation, and results of older generations are dropped. The
+    universe file is watched, and a changed universe is swapped in while the
+    selection is kept, as long as the selected tables still exist.
+    """
+    universe_reloaded = pyqtSignal(object, object)
+
+    def __init__(self, universe):
+        super().__init__(universe=universe)
+        self.planner = 'incremental'
+        self.generation = 0
+        self.worker = None
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(1)
         self.init_ui()
+        self.universe_reloaded.connect(self.swap_universe)
+        self.watcher = UniverseWatcher(universe, on_reload=self.universe_reloaded.emit)
+        self.watcher.start()
+
+    def swap_universe(self, universe, report):
+        """
+        Takes over a reloaded universe, keeping the selection. Shows how long
+        reloading took, or why the new universe can't be used.
+        """
+        state = self.freeze()
+        missing = [table for table in state.tables if table not in universe.tables]
+        if missing:
+            self.output.setText('Universe changed, but no longer has ' + ', '.join(missing))
+            return
+        self.selection_changed()
+        self.universe = universe
+        self.thaw(state)
+        self.output.setText('Universe reloaded in {:.2f} seconds'.format(report['seconds']))
+
+    def selection_changed(self):
+        """
+        Starts a new generation: planning or compiling that hasn't started yet
+        is cancelled, and results of work already running are ignored.
+        """
+        self.generation += 1
+        self.thread_pool.clear()
+
+    def run_in_background(self, function, finished):
+        """
+        Runs function on a snapshot of the query on the worker thread. If the
+        selection hasn't changed in the meantime, the query takes over the
+        snapshot and finished is called with the rest of the result. The last
+        worker is kept, so its signals outlive the run.
+        """
+        self.worker = Worker(self.generation, function, self.snapshot())
+        self.worker.signals.finished.connect(
+            lambda generation, result: self.background_finished(generation, result, finished))
+        self.worker.signals.failed.connect(self.background_failed)
+        self.thread_pool.start(self.worker)
+
+    def background_finished(self, generation, result, finished):
+        """
+        Handles the result of run_in_background.
+        """
+        if generation != self.generation:
+            return
+        snapshot, value = result
+        self.restore(snapshot)
+        finished(value)
+
+    def background_failed(self, generation, message):
+        """
+        Shows the error of run_in_background, unless the selection changed.
+        """
+        if generation == self.generation:
+            self.output.setText(message)
 
     def init_ui(self):
         """
@@ -117,6 +342,7 @@ class CreateQueryInterface(QMainWindow, Query):
         relevant buttons in the main window.
         """
         source = self.sender()
+        self.selection_changed()
         if pressed:
             self.add_tables(source.text())
         else:
@@ -146,53 +372,53 @@ class CreateQueryInterface(QMainWindow, Query):
 
     def pick_columns(self):
         """
-        When a table is selected, its name is stored in an attribute so it can
-        be called in subsequent functions. This method enumerates all columns
-        available in the selected table and creates checkboxes.
+        When a table is selected, a dialog with a search box and a list of its
+        columns is shown. Typing in the search box filters the list; checking a
+        column activates it. The list is a view on a ColumnModel, so only the
+        visible columns get drawn.
         """
         source = self.sender()
         selected_table = source.text()
         dialog = QDialog()
 
-        buttons = []
-        columns = self.tables[selected_table]['Columns']
-        maximal_name_length = max([len(column) for column in columns])
-        for index, column in zip(range(len(columns)),
-                                 sorted(columns)):
-            buttons.append(QCheckBox(dialog))
-            buttons[index].setText(column)
-            buttons[index].move(10 + (CHECKBOXHEIGHT + 6 * maximal_name_length) * (index//45),
-                                10 + index%45 * CHECKBOXHEIGHT)
-            buttons[index].clicked[bool].connect(self.activate_columns)
-            buttons[index].selected_table = selected_table
-            buttons[index].setChecked(column in self.active_columns[selected_table])
+        search_box = QLineEdit(dialog)
+        search_box.setPlaceholderText('Search columns')
+        model = ColumnModel(self, selected_table)
+        view = QListView(dialog)
+        view.setUniformItemSizes(True)
+        view.setModel(model)
+        search_box.textChanged.connect(model.set_filter)
+        model.dataChanged.connect(self.activate_columns)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(search_box)
+        layout.addWidget(view)
 
         dialog.setWindowTitle('Pick columns')
-        dialog.resize(20 + (CHECKBOXHEIGHT + 6 * maximal_name_length) * (len(columns)//45 + 1),
-                      20 + min(len(columns), 45) * CHECKBOXHEIGHT)
+        dialog.resize(300, 500)
         dialog.exec_()
 
-    def activate_columns(self, pressed):
+    def activate_columns(self):
         """
-        When a checkbox created by pick_columns is changed, it is added or removed
-        from the dictionary of activated columns. Enables another button.
+        When a column is checked in pick_columns, the button to specify where
+        statements becomes relevant.
         """
-
-        source = self.sender()
-        selected_table = source.selected_table
-        if pressed:
-            self.add_columns(selected_table, source.text())
-            self.where_button.setEnabled(True)
-        else:
-            self.remove_columns(selected_table, source.text())
+        self.selection_changed()
+        self.where_button.setEnabled(any(self.active_columns.values()))
 
     def specify_joins(self):
         """
         Dialog to set the way tables are joined. First the required joins are
-        computed by calling the find_joins method. Each of the joins gets a button
-        which creates another dialog.
+        computed by calling the find_joins method on the worker thread. Each of
+        the joins gets a button which creates another dialog.
         """
-        joins = self.find_joins()
+        self.run_in_background(plan_joins, self.show_joins)
+
+    def show_joins(self, joins):
+        """
+        Shows the joins found by specify_joins.
+        """
+        if not joins:
+            return
 
         dialog = QDialog()
         options = []
@@ -218,7 +444,7 @@ class CreateQueryInterface(QMainWindow, Query):
         table_tuple = source.joinTag
         try:
             how = self.tables[table_tuple[0]]['Joins'][table_tuple[1]][1]
-        except TypeError:
+        except (TypeError, KeyError):
             table_tuple = (table_tuple[1], table_tuple[0])
             how = self.tables[table_tuple[0]]['Joins'][table_tuple[1]][1]
 
@@ -248,6 +474,7 @@ class CreateQueryInterface(QMainWindow, Query):
         """
         source = self.sender()
         selected_join = source.selected_join
+        self.selection_changed()
         self.how_to_join[selected_join] = source.text()
 
     def specify_where(self):
@@ -333,6 +560,7 @@ class CreateQueryInterface(QMainWindow, Query):
         editor = source.linked_editor
         selected_table = source.selected_table
         selected_column = source.selected_column
+        self.selection_changed()
         self.add_where(editor.text(), selected_table, selected_column)
         for dialog in source.parent_dialog:
             dialog.close()
@@ -367,6 +595,7 @@ class CreateQueryInterface(QMainWindow, Query):
         """
         source = self.sender()
         source.setEnabled(False)
+        self.selection_changed()
         self.add_preset(source.text())
         self.column_button.setEnabled(True)
         self.compile_button.setEnabled(True)
@@ -376,18 +605,32 @@ class CreateQueryInterface(QMainWindow, Query):
     def print_query(self):
         """
         Compiles the query. The activated elements are added to the query and
-        the compile_query method is called. The result is printed in the Textdisplay.
+        the compile_query method is called on the worker thread. The result is
+        printed in the Textdisplay. If the selected tables can't be joined, the
+        error is shown instead.
         """
-        self.output.setText(self.compile_query())
+        self.output.setText('Compiling...')
+        self.run_in_background(compile_snapshot, self.output.setText)
 
 def main():
     """
-    Deploys the app
+    Deploys the app. A filedialog selects a JSON file to serve as context
+    (Universe). These files have their extension changed to .uni to make
+    filtering easier. The generated files will be in one specific directory, so
+    this location is hardcoded. The universe is loaded in the background while
+    a progress dialog is shown.
     """
     app = QApplication([])
-    interface = CreateQueryInterface()
+    filename = QFileDialog.getOpenFileName(
+        None,
+        'Select universe',
+        'R:/NL/Database Marketing/R library/SQL builder/Universes',
+        'Universes (*.uni)')[0]
+    if not filename:
+        sys.exit()
+    loader = UniverseLoader(filename)
     sys.exit(app.exec_())
-    print(interface)
+    print(loader)
 
 if __name__ == '__main__':
     main()
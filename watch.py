@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Hot reloading of universes for long-running processes. A UniverseWatcher
+polls the modification time and size of a universe file on a background
+thread. When they change and the contents really differ, the universe,
+including its graph and path index, is loaded again on that thread and then
+swapped in by replacing a single reference. Queries hold on to the universe
+they were created with, so a query that is compiling when the swap happens
+finishes against the old version; new work picks up the new one.
+
+Every reload is described by a report: the new version, the seconds it took,
+the time per phase of loading (such as parsing, building the graph and the
+path index), and the tables that were added, removed or changed.
+"""
+
+import os
+import threading
+import time
+
+from cache import file_hash
+from classes import Universe
+from stats import Stats, increment, measure
+
+
+def table_changes(old, new):
+    """
+    Tables added to, removed from and changed between two universes. Lazily
+    loaded tables are compared on their eagerly loaded keys.
+    """
+    added = [table for table in new.tables if table not in old.tables]
+    removed = [table for table in old.tables if table not in new.tables]
+    changed = [table for table in new.tables
+               if table in old.tables
+               and getattr(new.tables[table], 'eager', new.tables[table])
+               != getattr(old.tables[table], 'eager', old.tables[table])]
+    return added, removed, changed
+
+
+class UniverseWatcher:
+    """
+    Keeps universe up to date with its file, checking every interval seconds
+    once started. universe can be a loaded Universe or a filename; reloads use
+    the given loading options. With validate, a changed file with errors (see
+    analyzer.py) is not swapped in. on_reload, if given, is called from the
+    watching thread as on_reload(universe, report) after every swap. reports
+    holds the reports of all reloads, and failed reloads are reported with an
+    'error' and retried once the file changes again. stats records the time
+    of reloading and the number of reloads.
+    """
+
+    def __init__(self, universe, interval=2.0, precompute_paths=False,
+                 use_cache=False, lazy_columns=False, validate=False, on_reload=None,
+                 stats=None):
+        if not isinstance(universe, Universe):
+            universe = Universe(universe, precompute_paths, use_cache,
+                                lazy_columns=lazy_columns, validate=validate)
+        self.universe = universe
+        self.filename = universe.filename
+        self.interval = interval
+        self.options = {'precompute_paths': precompute_paths,
+                        'use_cache': use_cache,
+                        'lazy_columns': lazy_columns,
+                        'validate': validate}
+        self.on_reload = on_reload
+        self.stats = stats
+        self.reports = []
+        stat = os.stat(self.filename)
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.failed_signature = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def check(self):
+        """
+        Reloads the universe if its file changed. Returns the report of the
+        reload, or None if the file didn't change.
+        """
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature in (self.signature, self.failed_signature):
+            return None
+        if file_hash(self.filename) == self.universe.version:
+            self.signature = signature
+            return None
+        start = time.perf_counter()
+        phases = Stats()
+        try:
+            with measure(self.stats, 'reload'):
+                universe = Universe(self.filename, stats=phases, **self.options)
+        except (OSError, ValueError, LookupError, TypeError) as error:
+            report = {'error': '{}: {}'.format(type(error).__name__, error)}
+            self.failed_signature = signature
+            self.reports.append(report)
+            return report
+        added, removed, changed = table_changes(self.universe, universe)
+        report = {'version': universe.version,
+                  'seconds': time.perf_counter() - start,
+                  'phases': dict(phases.timings),
+                  'tables': len(universe.tables),
+                  'tables_added': added,
+                  'tables_removed': removed,
+                  'tables_changed': changed}
+        universe.stats = self.universe.stats
+        self.universe = universe
+        self.signature = signature
+        self.reports.append(report)
+        increment(self.stats, 'reloads')
+        if self.on_reload is not None:
+            self.on_reload(universe, report)
+        return report
+
+    def run(self):
+        """
+        Checks the file every interval seconds until stopped.
+        """
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """
+        Starts watching on a daemon thread. Returns the watcher.
+        """
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name='universe-watcher',
+                                           daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops watching and waits for a running check to finish.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None